@@ -5,11 +5,18 @@ from . import backends
 from .augmentation import Augmentation
 from .config import Config
 from .dataloader import DataLoader
-from .hyperparamoptimizer import HyperParamOptimizer
 from .metric import Metric
 from .model import Model
 from .predictor import Predictor
-from .report import Report
 from .trainer import Trainer
+# hyperopt and the report dependencies are not needed for inference
+try:
+    from .hyperparamoptimizer import HyperParamOptimizer
+except Exception as e:
+    print(e)
+try:
+    from .report import Report
+except Exception as e:
+    print(e)
 
 __version__ = '0.0.1'
\ No newline at end of file
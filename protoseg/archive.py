@@ -0,0 +1,113 @@
+import os
+import json
+import zipfile
+import tarfile
+import numpy as np
+import cv2
+
+# separates archive file and member in paths like data/train.zip::train/1_1.tif
+SEPARATOR = '::'
+
+_readers = {}
+
+
+class ArchiveReader():
+    """Random access to members of a zip archive or an uncompressed tar shard.
+
+    Zip members are found through the central directory, tar members through
+    an index of data offsets which is stored next to the shard.
+    File handles are opened lazily in every process, an index built before
+    forking is inherited by the child processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.handle = None
+        self.index = None
+        self.is_zip = zipfile.is_zipfile(path)
+
+    def open(self):
+        if self.pid == os.getpid():
+            return
+        if self.is_zip:
+            self.handle = zipfile.ZipFile(self.path, 'r')
+            if self.index is None:
+                self.index = {name: None for name in self.handle.namelist()
+                              if not name.endswith('/')}
+        else:
+            if self.index is None:
+                self.index = self.tar_index()
+            self.handle = open(self.path, 'rb')
+        self.pid = os.getpid()
+
+    def tar_index(self):
+        indexfile = self.path + '.index.json'
+        if os.path.isfile(indexfile) and os.path.getmtime(indexfile) >= os.path.getmtime(self.path):
+            with open(indexfile) as f:
+                return json.load(f)
+        with tarfile.open(self.path, 'r:') as tar:
+            index = {member.name: [member.offset_data, member.size]
+                     for member in tar if member.isfile()}
+        # processes which build the index at the same time must not read a partial file
+        tmpfile = '{}.{}.tmp'.format(indexfile, os.getpid())
+        try:
+            with open(tmpfile, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmpfile, indexfile)
+        except OSError as e:
+            print(e)
+        return index
+
+    def names(self):
+        self.open()
+        return sorted(self.index.keys())
+
+    def read(self, member):
+        self.open()
+        if self.is_zip:
+            return self.handle.read(member)
+        offset, size = self.index[member]
+        self.handle.seek(offset)
+        return self.handle.read(size)
+
+
+def reader(path):
+    if path not in _readers:
+        _readers[path] = ArchiveReader(path)
+    return _readers[path]
+
+
+def prepare(paths):
+    """opens the readers of all archives in paths, call it before forking
+    so worker processes inherit the indices instead of building them"""
+    for path in paths:
+        archive, member = split(path)
+        if member is not None:
+            reader(archive).open()
+
+
+def split(path):
+    """archive file and member of path, member is None for plain files"""
+    if SEPARATOR not in path:
+        return path, None
+    return path.split(SEPARATOR, 1)
+
+
+def join(archive, member):
+    return archive + SEPARATOR + member
+
+
+def imread(path, flags=cv2.IMREAD_COLOR):
+    """cv2.imread which also reads members of archives"""
+    archive, member = split(path)
+    if member is None:
+        return cv2.imread(path, flags)
+    data = reader(archive).read(member)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+def getmtime(path):
+    """mtime of file or of the archive containing it"""
+    archive, _ = split(path)
+    return os.path.getmtime(archive)
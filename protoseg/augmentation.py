@@ -2,10 +2,16 @@
 from random import randint, randrange, uniform
 import numpy as np
 import cv2
-import imgaug as ia
 from imgaug import augmenters as iaa
 
 
+def writable(img):
+    """contiguous array which may be modified in place"""
+    if img.flags['C_CONTIGUOUS'] and img.flags['WRITEABLE']:
+        return img
+    return np.array(img, order='C')
+
+
 class Augmentation():
 
     img_augmenters = []
@@ -13,10 +19,15 @@ class Augmentation():
     img_seq = None
     shape_seq = None
     seed = 1
+    noise_bank = None
+    noise_bank_amount = None
 
     def __init__(self, config):
         self.config = config
         assert(config)
+        self.img_augmenters = []
+        self.shape_augmenters = []
+        self.luts = {}
         for aug in self.config['img_augmentation']:
             name = list(aug.keys())[0]
             parameters = aug[name]
@@ -29,6 +40,20 @@ class Augmentation():
             augmenter = getattr(iaa, name)(**parameters)
             self.shape_augmenters.append(augmenter)
 
+        self.img_seq = iaa.Sequential(
+            [iaa.Sometimes(0.5, augmenter) for augmenter in self.img_augmenters])
+        self.shape_seq = iaa.Sequential(
+            [iaa.Sometimes(0.5, augmenter) for augmenter in self.shape_augmenters])
+        self.reseed(self.config.get('seed') or self.seed)
+
+    def reseed(self, seed):
+        """imgaug sequences are seeded from this stream instead of the global ia.seed"""
+        self.seed = seed
+        self.random_state = np.random.RandomState(seed % 2**32)
+
+    def next_seed(self):
+        return self.random_state.randint(0, 2**31 - 1)
+
     def random_flip(self, img, mask=None):
         """Apply random flip to single image and label."""
         if not self.config['flip']:
@@ -74,11 +99,12 @@ class Augmentation():
 
         return img
 
-    def random_shift(self, img, mask=None):
+    def random_shift(self, img, mask=None, scale=1.0):
         """Add random horizontal/vertical shifts to image dataset to imitate
-        steering away from sides."""
-        h_shift = self.config['horizontal_shift']
-        v_shift = self.config['vertical_shift']
+        steering away from sides. Shifts are given in source pixels and
+        multiplied by scale for resized images."""
+        h_shift = self.config['horizontal_shift'] * scale
+        v_shift = self.config['vertical_shift'] * scale
 
         rows = img.shape[0]
         cols = img.shape[1]
@@ -96,9 +122,86 @@ class Augmentation():
 
         return img, mask
 
+    def random_geometry(self, img, mask=None, dsize=None, mask_dsize=None, scale=1.0):
+        """Random flip, rotation, shift and zoom fused into one affine warp,
+        optionally straight to the output size (cv2 dsize) of image and mask.
+        Shifts are multiplied by scale like in random_shift."""
+        rows = img.shape[0]
+        cols = img.shape[1]
+        dsize = dsize or (cols, rows)
+        mask_dsize = mask_dsize or dsize
+
+        matrix = np.eye(3)
+        if self.config['flip'] and uniform(0, 1) > 0.5:
+            flip = 1
+            if self.config['horizontal_flip']:
+                flip = randint(0, 1)
+            if flip == 1:
+                # mirror columns like cv2.flip(img, 1)
+                matrix = np.array([[-1, 0, cols - 1], [0, 1, 0], [0, 0, 1]]).dot(matrix)
+            else:
+                matrix = np.array([[1, 0, 0], [0, -1, rows - 1], [0, 0, 1]]).dot(matrix)
+
+        degree = self.config['rotation_degree']
+        rotation = cv2.getRotationMatrix2D((cols / 2, rows / 2), uniform(-degree, degree), 1.0)
+        matrix = np.vstack([rotation, [0, 0, 1]]).dot(matrix)
+
+        h_shift = self.config['horizontal_shift'] * scale
+        v_shift = self.config['vertical_shift'] * scale
+        horizontal = uniform(- h_shift / 2, h_shift / 2)
+        vertical = uniform(- v_shift / 2, v_shift / 2)
+        matrix = np.array([[1, 0, horizontal], [0, 1, vertical], [0, 0, 1]]).dot(matrix)
+
+        rand_size = uniform(-1, 1)
+        if rand_size < 0:
+            zoom = 1 + self.config['zoom_out'] * rand_size
+        else:
+            zoom = 1 + self.config['zoom_in'] * rand_size
+        # zoomed out images are placed randomly like random_padding does
+        offset_x = offset_y = 0
+        if zoom < 1:
+            offset_x = uniform(-1, 1) * cols * (1 - zoom) / 2
+            offset_y = uniform(-1, 1) * rows * (1 - zoom) / 2
+        zoom_mtrx = np.array([[zoom, 0, (1 - zoom) * cols / 2 + offset_x],
+                              [0, zoom, (1 - zoom) * rows / 2 + offset_y],
+                              [0, 0, 1]])
+        matrix = zoom_mtrx.dot(matrix)
+
+        def to_size(size):
+            scale = np.diag([size[0] / cols, size[1] / rows, 1])
+            return scale.dot(matrix)[:2]
+
+        img = cv2.warpAffine(img, to_size(dsize), dsize, flags=cv2.INTER_LINEAR)
+        if mask is None:
+            return img
+        mask = cv2.warpAffine(mask, to_size(mask_dsize), mask_dsize,
+                              flags=cv2.INTER_NEAREST)
+        return img, mask
+
+    def noise(self, size, amount):
+        """size values of a precomputed uint8 noise bank starting at a random offset"""
+        if (self.noise_bank is None or self.noise_bank_amount != amount or
+                self.noise_bank.size < 2 * size):
+            bank = np.zeros((max(2 * size, 1 << 22), 1), dtype=np.uint8)
+            cv2.randn(bank, (0), (amount))
+            self.noise_bank = bank.ravel()
+            self.noise_bank_amount = amount
+        offset = self.random_state.randint(0, self.noise_bank.size - size + 1)
+        return self.noise_bank[offset:offset + size]
+
+    def lut(self, kind, value, function):
+        """256 entry lookup table, cached per kind and value"""
+        key = (kind, value)
+        if key not in self.luts:
+            # float32 like the arithmetic of float images, so both round the same way
+            values = function(np.arange(256, dtype=np.float32))
+            self.luts[key] = np.clip(values, 0, 255).astype(np.uint8)
+        return self.luts[key]
+
     def random_noise(self, img):
         """Add random noise to image dataset.
         noise_chance: probability that noise will be applied.
+        uint8 images are modified in place with saturating addition.
         """
         amount = self.config['noise_amount']
         noise_chance = self.config['noise_chance']
@@ -107,15 +210,19 @@ class Augmentation():
             return img
 
         if uniform(0, 1) > noise_chance:
-            # needs preallocated input image
-            noise = np.zeros_like(img, img.dtype)
-            noise = cv2.randn(noise, (0), (amount))
-            img = np.where((255 - img) < noise, 255, img + noise)
+            if img.dtype != np.uint8:
+                noise = np.zeros_like(img, img.dtype)
+                noise = cv2.randn(noise, (0), (amount))
+                return np.where((255 - img) < noise, 255, img + noise)
+            img = writable(img)
+            noise = self.noise(img.size, amount).reshape(img.shape)
+            cv2.add(img, noise, dst=img)
 
         return img
 
     def random_brightness(self, img):
-        """Add random brightness to give image dataset to imitate day/night."""
+        """Add random brightness to give image dataset to imitate day/night.
+        uint8 images are modified in place through a lookup table."""
 
         min_bright = self.config['min_bright']
         max_bright = self.config['max_bright']
@@ -123,6 +230,19 @@ class Augmentation():
         max_val = self.config['max_val']
         # random_bright = np.random.uniform(min_bright, max_bright, 1)[0]
         random_bright = randrange(min_bright, max_bright)
+        if random_bright == 0:
+            return img
+        if img.dtype == np.uint8:
+            if random_bright > 0:
+                lut = self.lut('bright', (random_bright, max_val),
+                               lambda v: np.minimum(v + random_bright, max_val))
+            else:
+                lut = self.lut('bright', (random_bright, min_val),
+                               lambda v: np.maximum(v + random_bright, min_val))
+            img = writable(img)
+            cv2.LUT(img, lut, dst=img)
+            return img
+
         data_type = img.dtype
         if random_bright > 0:
             # add brightness
@@ -135,6 +255,26 @@ class Augmentation():
 
         return img.astype(data_type)
 
+    def random_contrast(self, img):
+        """Scale contrast around mid gray by a random factor between min_contrast and max_contrast."""
+        min_contrast = self.config['min_contrast']
+        max_contrast = self.config['max_contrast']
+        if min_contrast == 1 and max_contrast == 1:
+            return img
+        # factors are rounded so the number of cached tables stays small
+        contrast = round(uniform(min_contrast, max_contrast), 2)
+        min_val = self.config['min_val']
+        max_val = self.config['max_val']
+        if img.dtype != np.uint8:
+            data_type = img.dtype
+            img = np.clip((img - 128.0) * contrast + 128, min_val, max_val)
+            return img.astype(data_type)
+        lut = self.lut('contrast', (contrast, min_val, max_val),
+                       lambda v: np.clip((v - 128) * contrast + 128, min_val, max_val))
+        img = writable(img)
+        cv2.LUT(img, lut, dst=img)
+        return img
+
     def random_padding(self, img, output_size, override_random=None):
         """Add random horizontal/vertical shifts and increases size of image to output_size."""
 
@@ -232,22 +372,24 @@ class Augmentation():
         return img, mask
 
     def img_augmentation(self, img):
-        ia.seed(self.seed)
-        self.seed += 1
-        augmenters = []
-        for augmenter in self.img_augmenters:
-            augmenters.append(iaa.Sometimes(0.5, augmenter))
-        self.img_seq = iaa.Sequential(augmenters)
-        images_aug = self.img_seq.augment_images([img])
-        return images_aug[0]
+        images, _ = self.augment_batch([img], shape=False)
+        return images[0]
 
     def shape_augmentation(self, img, mask):
-        ia.seed(self.seed)
-        self.seed += 1
-        augmenters = []
-        for augmenter in self.shape_augmenters:
-            augmenters.append(iaa.Sometimes(0.5, augmenter))
-        self.shape_seq = iaa.Sequential(augmenters).to_deterministic()
-        imgs_aug = self.shape_seq.augment_images([img])
-        masks_aug = self.shape_seq.augment_images([mask])
-        return imgs_aug[0], masks_aug[0]
+        images, masks = self.augment_batch([img], [mask], image=False)
+        return images[0], masks[0]
+
+    def augment_batch(self, images, masks=None, shape=True, image=True):
+        """Runs the imgaug sequences once for a list of images and masks.
+        Every sample gets its own random parameters, masks get the same
+        shape augmentation as their image."""
+        if shape and self.shape_augmenters:
+            self.shape_seq.seed_(self.next_seed())
+            shape_seq = self.shape_seq.to_deterministic()
+            images = shape_seq.augment_images(images)
+            if masks is not None:
+                masks = shape_seq.augment_images(masks)
+        if image and self.img_augmenters:
+            self.img_seq.seed_(self.next_seed())
+            images = self.img_seq.augment_images(images)
+        return images, masks
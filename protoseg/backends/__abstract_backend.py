@@ -1,12 +1,25 @@
 
 class AbstractBackend():
+    mask_dtype = 'uint8'  # dtype of preallocated mask batches
+
     def dataloader_format(self, img, mask):
         return img, mask
 
+    def batch_format(self, img_batch, mask_batch=None):
+        """formats NCHW numpy batches filled by the DataLoader"""
+        if mask_batch is None:
+            return img_batch
+        return img_batch, mask_batch
+
     def load_model(self, config, modelfile):
         pass
     
-    def save_model(self, model):
+    def save_model(self, model, writer=None, tag=None):
+        """snapshots the weights and writes them with a CheckpointWriter"""
+        pass
+
+    def export_model(self, model):
+        """exports the saved weights for deployment"""
         pass
 
     def init_trainer(self, trainer):
@@ -0,0 +1,85 @@
+from random import randint, uniform
+import numpy as np
+
+
+class BatchAugmentation():
+    """Samples per image parameters of flip, rotation, shift, zoom, brightness,
+    contrast and noise for a whole collated batch.
+
+    The framework specific subclasses apply them with vectorized operations.
+    Affine matrices map normalized output coordinates to input coordinates
+    like affine_grid expects them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        assert(config)
+
+    def geometric(self):
+        config = self.config
+        return bool(config['flip'] or config['rotation_degree'] or
+                    config['horizontal_shift'] or config['vertical_shift'] or
+                    config['zoom_in'] or config['zoom_out'])
+
+    def shift_scale(self, cols):
+        """shifts are given in source pixels"""
+        return cols / self.config['orig_width']
+
+    def affine(self, n, rows, cols):
+        config = self.config
+        scale = self.shift_scale(cols)
+        # normalized to pixel coordinates, both centered
+        pixels = np.diag([cols / 2.0, rows / 2.0, 1])
+        normalized = np.linalg.inv(pixels)
+        thetas = np.zeros((n, 2, 3), dtype=np.float32)
+        for i in range(n):
+            matrix = np.eye(3)
+            if config['flip'] and uniform(0, 1) > 0.5:
+                flip = 1
+                if config['horizontal_flip']:
+                    flip = randint(0, 1)
+                if flip == 1:
+                    matrix = np.diag([-1, 1, 1]).dot(matrix)
+                else:
+                    matrix = np.diag([1, -1, 1]).dot(matrix)
+
+            degree = config['rotation_degree']
+            angle = np.deg2rad(uniform(-degree, degree))
+            rotation = np.array([[np.cos(angle), np.sin(angle), 0],
+                                 [-np.sin(angle), np.cos(angle), 0],
+                                 [0, 0, 1]])
+            matrix = normalized.dot(rotation).dot(pixels).dot(matrix)
+
+            h_shift = config['horizontal_shift'] * scale
+            v_shift = config['vertical_shift'] * scale
+            horizontal = uniform(- h_shift / 2, h_shift / 2) * 2 / cols
+            vertical = uniform(- v_shift / 2, v_shift / 2) * 2 / rows
+            matrix = np.array([[1, 0, horizontal], [0, 1, vertical], [0, 0, 1]]).dot(matrix)
+
+            rand_size = uniform(-1, 1)
+            if rand_size < 0:
+                zoom = 1 + config['zoom_out'] * rand_size
+            else:
+                zoom = 1 + config['zoom_in'] * rand_size
+            offset_x = offset_y = 0
+            if zoom < 1:
+                offset_x = uniform(-1, 1) * (1 - zoom)
+                offset_y = uniform(-1, 1) * (1 - zoom)
+            matrix = np.array([[zoom, 0, offset_x], [0, zoom, offset_y], [0, 0, 1]]).dot(matrix)
+
+            thetas[i] = np.linalg.inv(matrix)[:2]
+        return thetas
+
+    def brightness(self, n):
+        return np.random.randint(self.config['min_bright'], self.config['max_bright'],
+                                 size=n).astype(np.float32)
+
+    def contrast(self, n):
+        return np.random.uniform(self.config['min_contrast'], self.config['max_contrast'],
+                                 size=n).astype(np.float32)
+
+    def noise_mask(self, n):
+        """images which get noise, keeps the noise_chance semantics of Augmentation.random_noise"""
+        if self.config['noise_chance'] < 0.01 or self.config['noise_amount'] < 1:
+            return None
+        return (np.random.uniform(0, 1, size=n) > self.config['noise_chance']).astype(np.float32)
@@ -45,7 +45,11 @@ for x in glob(join(pwd, '*.py')):
         class_name = basename(x)[:-3]
         full_class = __package__ + '.' + class_name + '.' + class_name
         register_backend(class_name, full_class)
-set_backend('gluoncv_backend')
+try:
+    set_backend('gluoncv_backend')
+except Exception as e:
+    # inference only installs have no mxnet, the cli tools set the backend of the config
+    print(e)
 
 __all__ = [
     'AbstractBackend',
@@ -0,0 +1,37 @@
+import mxnet
+
+from .__batch_augmentation import BatchAugmentation
+
+
+class MXNetAugmentation(BatchAugmentation):
+    """Batch augmentation of float NCHW images and NHW labels with GridGenerator and BilinearSampler."""
+
+    def __call__(self, images, labels):
+        n, _, rows, cols = images.shape
+        config = self.config
+        ctx = images.context
+        if self.geometric():
+            theta = mxnet.nd.array(self.affine(n, rows, cols).reshape(n, 6), ctx=ctx)
+            grid = mxnet.nd.GridGenerator(data=theta, transform_type='affine',
+                                          target_shape=(rows, cols))
+            images = mxnet.nd.BilinearSampler(images, grid)
+            label_rows, label_cols = labels.shape[1:]
+            grid = mxnet.nd.GridGenerator(data=theta, transform_type='affine',
+                                          target_shape=(label_rows, label_cols))
+            labels = mxnet.nd.BilinearSampler(labels.expand_dims(1), grid)
+            # labels are binary, rounding restores them after bilinear sampling
+            labels = mxnet.nd.round(labels).squeeze(axis=1)
+
+        shape = (n, 1, 1, 1)
+        noise_mask = self.noise_mask(n)
+        if noise_mask is not None:
+            noise = mxnet.nd.random.normal(0, config['noise_amount'], shape=images.shape, ctx=ctx)
+            noise = mxnet.nd.relu(noise) * mxnet.nd.array(noise_mask, ctx=ctx).reshape(shape)
+            images = images + noise
+        images = mxnet.nd.broadcast_add(
+            images, mxnet.nd.array(self.brightness(n), ctx=ctx).reshape(shape))
+        if config['min_contrast'] != 1 or config['max_contrast'] != 1:
+            contrast = mxnet.nd.array(self.contrast(n), ctx=ctx).reshape(shape)
+            images = mxnet.nd.broadcast_mul(images - 128, contrast) + 128
+        images = mxnet.nd.clip(images, config['min_val'], config['max_val'])
+        return images, labels
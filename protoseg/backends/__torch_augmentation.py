@@ -0,0 +1,36 @@
+import torch
+import torch.nn.functional as F
+
+from .__batch_augmentation import BatchAugmentation
+
+
+class TorchAugmentation(BatchAugmentation):
+    """Batch augmentation of float NCHW images and NHW labels with affine_grid and grid_sample."""
+
+    def __call__(self, images, labels):
+        n, _, rows, cols = images.shape
+        config = self.config
+        if self.geometric():
+            theta = torch.from_numpy(self.affine(n, rows, cols)).to(images.device)
+            grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+            images = F.grid_sample(images, grid, mode='bilinear',
+                                   padding_mode='zeros', align_corners=False)
+            labels = labels.unsqueeze(1).float()
+            grid = F.affine_grid(theta, list(labels.shape), align_corners=False)
+            labels = F.grid_sample(labels, grid, mode='nearest',
+                                   padding_mode='zeros', align_corners=False)
+            labels = labels.squeeze(1).long()
+
+        shape = (n, 1, 1, 1)
+        noise_mask = self.noise_mask(n)
+        if noise_mask is not None:
+            noise = torch.randn_like(images).mul_(config['noise_amount']).clamp_(min=0)
+            noise.mul_(torch.from_numpy(noise_mask).view(shape))
+            images = images + noise
+        brightness = torch.from_numpy(self.brightness(n)).view(shape)
+        images = images + brightness
+        if config['min_contrast'] != 1 or config['max_contrast'] != 1:
+            contrast = torch.from_numpy(self.contrast(n)).view(shape)
+            images = (images - 128).mul_(contrast).add_(128)
+        images = images.clamp_(config['min_val'], config['max_val'])
+        return images, labels
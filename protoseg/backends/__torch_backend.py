@@ -0,0 +1,366 @@
+from __future__ import absolute_import
+import os
+import copy
+import contextlib
+import functools
+import numpy as np
+import cv2
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.onnx
+from torch.utils import data
+from tqdm import tqdm
+
+from protoseg.backends import AbstractBackend
+from protoseg.backends.__torch_augmentation import TorchAugmentation
+from protoseg.checkpoint import CheckpointWriter
+from protoseg import distributed
+from protoseg import summary
+
+from tensorboardX import SummaryWriter
+
+
+def worker_init(cores, worker_id):
+    """reseeds the augmentation of a loader worker and pins it to one of cores"""
+    info = data.get_worker_info()
+    if hasattr(info.dataset, 'reseed'):
+        info.dataset.reseed(info.seed + distributed.rank() * info.num_workers)
+    if cores:
+        # the workers of all ranks of this host take the last cores one by one
+        index = distributed.local_rank() * info.num_workers + worker_id
+        os.sched_setaffinity(0, [cores[-1 - index % len(cores)]])
+
+
+class TorchBackend(AbstractBackend):
+    """Training, checkpoints, summaries, onnx export and prediction of torch models.
+
+    Backends implement load_model and may override loss_function.
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    mask_dtype = 'int64'
+    dummy_input = None  # used for onnx export
+    graph_exported = False
+    compiled = {}  # compiled forwards by input shape and training mode
+    cores = None  # cores of the process before the trainer was pinned
+    worker_cores = None  # cores the loader workers are pinned to
+
+    def __init__(self):
+        AbstractBackend.__init__(self)
+
+    def parallel_model(self, config, model):
+        """wraps the model for data parallel training"""
+        if distributed.enabled(config):
+            # one process per rank, gradients are all-reduced by gloo
+            if not torch.distributed.is_initialized():
+                torch.distributed.init_process_group(backend='gloo')
+            model = torch.nn.parallel.DistributedDataParallel(model)
+        else:
+            model = torch.nn.DataParallel(
+                model, device_ids=range(torch.cuda.device_count()))
+        self.dummy_input = None
+        self.graph_exported = False
+        self.compiled = {}
+        return model
+
+    def save_model(self, model, writer=None, tag=None):
+        m = model.model
+        try:
+            m = model.model.module
+        except Exception:
+            pass
+        # snapshot on cpu, training continues while it is written
+        state = {
+            "model_state": {key: value.detach().to('cpu', copy=True)
+                            for key, value in m.state_dict().items()}
+        }
+        writer = writer or CheckpointWriter(background=False)
+        writer.write(model.modelfile, torch.save, state, tag=tag)
+
+    def export_model(self, model):
+        """exports the model to onnx if the checkpoint is newer than the onnx file"""
+        onnxfile = os.path.splitext(model.modelfile)[0] + ".onnx"
+        if not os.path.isfile(model.modelfile):
+            return
+        if os.path.isfile(onnxfile) and os.path.getmtime(onnxfile) >= os.path.getmtime(model.modelfile):
+            return
+        m = model.model
+        try:
+            m = model.model.module
+        except Exception:
+            pass
+        m = copy.deepcopy(m).to(torch.device('cpu')).eval()
+        dummy_input = self.dummy_input
+        if dummy_input is None:
+            dummy_input = torch.zeros(1, 3, model.config['width'], model.config['height'])
+        try:
+            torch.onnx.export(m, dummy_input[:1], onnxfile, input_names=['input'], output_names=['output'],
+                              dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}})
+            print('saved model to:', onnxfile)
+        except Exception as e:
+            print(e)
+
+    def get_optimizer(self, name, parameters, config):
+        optimizer = None
+        if name == 'sgd':
+            optimizer = torch.optim.SGD(parameters,
+                                        lr=config['learn_rate'])
+        elif name == 'adadelta':
+            optimizer = torch.optim.Adadelta(parameters,
+                                             lr=config['learn_rate'])
+        elif name == 'adagrad':
+            optimizer = torch.optim.Adagrad(
+                parameters, lr=config['learn_rate'])
+        elif name == 'adam':
+            optimizer = torch.optim.Adam(parameters, lr=config['learn_rate'])
+        elif name == 'rmsprop':
+            optimizer = torch.optim.RMSprop(
+                parameters, lr=config['learn_rate'])
+        else:
+            optimizer = torch.optim.SGD(parameters,
+                                        lr=config['learn_rate'])
+        return optimizer
+
+    def autocast(self, config):
+        """bfloat16 autocast if precision is bfloat16, the weights stay float32"""
+        precision = config.get('precision', 'float32')
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16,
+                              enabled=precision == 'bfloat16')
+
+    def forward(self, model, images, config):
+        """forward pass, traced or compiled if config compile is 'trace' or 'compile'
+
+        Compiled forwards are cached per input shape and training mode,
+        the model runs eager if compilation fails.
+        """
+        mode = config.get('compile', False)
+        if not mode:
+            return model(images)
+        if isinstance(model, nn.DataParallel) and torch.cuda.device_count() <= 1:
+            model = model.module
+        if isinstance(model, nn.parallel.DistributedDataParallel) and mode == 'trace':
+            # a trace would bypass the gradient synchronisation
+            return model(images)
+        key = (id(model), tuple(images.shape), model.training)
+        function = self.compiled.get(key)
+        if function is None:
+            try:
+                if mode == 'trace':
+                    function = torch.jit.trace(model, images, check_trace=False)
+                elif mode == 'compile':
+                    function = torch.compile(model)
+                else:
+                    raise Exception('unknown compile mode ' + str(mode))
+                outputs = function(images)
+                self.compiled[key] = function
+                return outputs
+            except Exception as e:
+                print('compilation failed, running eager:', e)
+                function = model
+                self.compiled[key] = function
+        return function(images)
+
+    def init_trainer(self, trainer):
+        if hasattr(trainer.model.model.module, "optimizer"):
+            print("Using custom optimizer")
+            optimizer = trainer.model.model.module.optimizer(
+                trainer.model.model.model.parameters())
+        else:
+            trainer.optimizer = self.get_optimizer(trainer.config['optimizer'], trainer.model.model.parameters(),
+                                                   config=trainer.config)
+
+        trainer.loss_function = self.loss_function(trainer.model.model.module)
+
+        trainer.batch_augmentation = None
+        if trainer.config['batch_augmentation']:
+            trainer.batch_augmentation = TorchAugmentation(trainer.config)
+
+        if distributed.enabled(trainer.config):
+            # different augmentations on every rank
+            trainer.dataloader.reseed((trainer.config['seed'] or 0) + distributed.rank())
+
+        self.pin_trainer(trainer.config)
+        if trainer.config['num_threads'] > 0:
+            torch.set_num_threads(trainer.config['num_threads'])
+        # created once, the workers persist between epochs
+        trainer.train_loader = self.data_loader(trainer.config, trainer.dataloader, shuffle=True)
+        trainer.val_loader = None
+        if trainer.valdataloader:
+            trainer.val_loader = self.data_loader(trainer.config, trainer.valdataloader, shuffle=False)
+
+    def loss_function(self, model):
+        if hasattr(model, "loss"):
+            print("Using custom loss")
+            return model.loss
+        return F.cross_entropy
+
+    def pin_trainer(self, config):
+        """with worker_affinity the loader workers of all local ranks take the last cores,
+        the training processes keep the remaining ones for their threads"""
+        self.worker_cores = None
+        if not (config['worker_affinity'] and config['num_workers'] > 0 and hasattr(os, 'sched_setaffinity')):
+            return
+        if self.cores is None:
+            self.cores = sorted(os.sched_getaffinity(0))
+        self.worker_cores = self.cores
+        workers = distributed.local_world_size() * config['num_workers']
+        if workers >= len(self.cores):
+            # too few cores, workers and model share them
+            return
+        os.sched_setaffinity(0, self.cores[:-workers])
+        if config['num_threads'] == 0:
+            threads = (len(self.cores) - workers) // distributed.local_world_size()
+            torch.set_num_threads(max(threads, 1))
+
+    def data_loader(self, config, dataset, shuffle):
+        sampler = None
+        if shuffle and distributed.enabled(config):
+            # every rank trains on its own shard
+            sampler = data.distributed.DistributedSampler(dataset, shuffle=True)
+        options = {}
+        if config['num_workers'] > 0:
+            options = {'prefetch_factor': config['prefetch_factor'],
+                       'persistent_workers': config['persistent_workers'],
+                       'worker_init_fn': functools.partial(worker_init, self.worker_cores)}
+        return data.DataLoader(
+            dataset, batch_size=config['batch_size'], num_workers=config['num_workers'],
+            pin_memory=config['pin_memory'] and self.device.type == 'cuda',
+            shuffle=shuffle and sampler is None, sampler=sampler, **options
+        )
+
+    def dataloader_format(self, img, mask=None):
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        img = np.transpose(img, axes=[2, 0, 1])
+        if mask is None:
+            return img.astype(np.float32)
+        if mask.ndim == 3:
+            mask = cv2.cvtColor(mask, cv2.COLOR_RGB2GRAY)
+
+        mask[mask > 0] = 1  # binary mask
+        img = img.astype(np.float32)
+        mask = mask.astype(np.int64)
+        return torch.from_numpy(img), torch.from_numpy(mask)
+
+    def batch_format(self, img_batch, mask_batch=None):
+        if mask_batch is None:
+            return torch.from_numpy(img_batch)
+        return torch.from_numpy(img_batch), torch.from_numpy(mask_batch)
+
+    def train_epoch(self, trainer):
+        batch_size = trainer.config['batch_size']
+        summarysteps = trainer.config['summarysteps']
+        # summed on the device, read back only at summary steps
+        epoch_loss = torch.zeros((), device=self.device)
+
+        dataloader = trainer.train_loader
+        if isinstance(dataloader.sampler, data.distributed.DistributedSampler):
+            dataloader.sampler.set_epoch(trainer.epoch)
+
+        accumulate_steps = trainer.config['accumulate_steps']
+        micro_batches = 0
+        trainer.optimizer.zero_grad()
+
+        for step, (images, labels) in enumerate(tqdm(dataloader)):
+            trainer.global_step += 1
+            trainer.model.model.train()
+            if self.dummy_input is None:
+                self.dummy_input = images.to(torch.device('cpu'))
+            if trainer.batch_augmentation:
+                images, labels = trainer.batch_augmentation(images, labels)
+            images = images.to(self.device)
+            labels = labels.to(self.device)
+
+            # gradients of accumulate_steps micro batches are summed up,
+            # distributed models all-reduce them only for the last one
+            sync = micro_batches + 1 == accumulate_steps or step + 1 == len(dataloader)
+            with self.no_sync(trainer.model.model, sync):
+                with self.autocast(trainer.config):
+                    outputs = self.forward(trainer.model.model, images, trainer.config)
+
+                # loss in float32
+                loss = trainer.loss_function(input=outputs.float(), target=labels)
+                (loss / accumulate_steps).backward()
+            micro_batches += 1
+            if micro_batches == accumulate_steps:
+                trainer.optimizer.step()
+                trainer.optimizer.zero_grad()
+                micro_batches = 0
+            epoch_loss += loss.detach()
+
+            if trainer.global_step % summarysteps == 0:
+                trainer.loss += epoch_loss.item()
+                epoch_loss.zero_()
+                loss_value = loss.item()
+                print('{0:.4f} --- loss: {1:.6f}'.format(trainer.global_step *
+                                                         batch_size / len(trainer.dataloader), loss_value))
+                if trainer.summarywriter:
+                    trainer.summarywriter.add_scalar(
+                        trainer.name+'loss', loss_value, global_step=trainer.global_step)
+                    trainer.summarywriter.add_image(
+                        trainer.name+'image', images[0], global_step=trainer.global_step)
+                    trainer.summarywriter.add_image(
+                        trainer.name+'mask', labels[0], global_step=trainer.global_step)
+                    # argmax and host copy of the first sample only if the image is logged
+                    summary.add_image(trainer.summarywriter, trainer.name+'predicted',
+                                      lambda: outputs[0].detach().argmax(0), global_step=trainer.global_step)
+                    if not self.graph_exported:
+                        try:
+                            trainer.summarywriter.add_graph(
+                                trainer.model.model, images)
+                            self.graph_exported = True
+                        except Exception as e:
+                            print(e)
+
+        if micro_batches > 0:
+            # remaining micro batches of the epoch, rescaled to their mean
+            for parameter in trainer.model.model.parameters():
+                if parameter.grad is not None:
+                    parameter.grad.mul_(accumulate_steps / micro_batches)
+            trainer.optimizer.step()
+            trainer.optimizer.zero_grad()
+        trainer.loss += epoch_loss.item()
+
+    def no_sync(self, model, sync):
+        """skips the gradient all-reduce of distributed models unless sync"""
+        if sync or not isinstance(model, torch.nn.parallel.DistributedDataParallel):
+            return contextlib.nullcontext()
+        return model.no_sync()
+
+    def validate_epoch(self, trainer):
+        dataloader = trainer.val_loader
+        # every sample is scored, the trainer logs the metrices of the epoch
+        for i, (X_batch, y_batch) in enumerate(dataloader):
+            prediction = self.batch_predict(trainer, X_batch)
+            trainer.metric.update(prediction, y_batch.numpy())
+            if i == 0 and trainer.summarywriter:
+                trainer.summarywriter.add_image(
+                    trainer.name+"val_image", (X_batch[0]/255.0), global_step=trainer.epoch)
+                trainer.summarywriter.add_image(
+                    trainer.name+"val_mask", (y_batch[0]), global_step=trainer.epoch)
+                trainer.summarywriter.add_image(
+                    trainer.name+"val_predicted", (prediction[0]), global_step=trainer.epoch)
+
+    def get_summary_writer(self, logdir='results/'):
+        return SummaryWriter(log_dir=logdir)
+
+    def predict(self, predictor, img):
+        img_batch = [img]
+        return self.batch_predict(predictor, img_batch)[0]
+
+    def batch_predict(self, predictor, img_batch):
+        model = predictor.model.model
+
+        try:
+            model = model.module
+        except Exception:
+            pass
+        model.eval()
+        if not torch.is_tensor(img_batch):
+            img_batch = torch.from_numpy(np.stack(img_batch))
+        images = img_batch.to(self.device)
+        with torch.no_grad(), self.autocast(predictor.config):
+            outputs = self.forward(model, images, predictor.config)
+        pred = outputs.float().max(1)[1].cpu().numpy()
+        return pred
@@ -0,0 +1,143 @@
+import copy
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+class ConvBNReLU(nn.Sequential):
+    """3x3 convolution, batch norm and relu, depthwise separable if depthwise"""
+
+    def __init__(self, in_channels, out_channels, stride=1, depthwise=False):
+        if depthwise and in_channels > 3:
+            layers = [nn.Conv2d(in_channels, in_channels, 3, stride=stride, padding=1, groups=in_channels, bias=False),
+                      nn.BatchNorm2d(in_channels),
+                      nn.ReLU(inplace=True),
+                      nn.Conv2d(in_channels, out_channels, 1, bias=False),
+                      nn.BatchNorm2d(out_channels),
+                      nn.ReLU(inplace=True)]
+        else:
+            layers = [nn.Conv2d(in_channels, out_channels, 3, stride=stride, padding=1, bias=False),
+                      nn.BatchNorm2d(out_channels),
+                      nn.ReLU(inplace=True)]
+        nn.Sequential.__init__(self, *layers)
+
+
+class ResidualBlock(nn.Module):
+
+    def __init__(self, in_channels, out_channels, stride=1, depthwise=False):
+        nn.Module.__init__(self)
+        self.conv1 = ConvBNReLU(in_channels, out_channels, stride, depthwise)
+        self.conv2 = ConvBNReLU(out_channels, out_channels, 1, depthwise)
+        self.shortcut = None
+        if stride != 1 or in_channels != out_channels:
+            self.shortcut = nn.Sequential(nn.Conv2d(in_channels, out_channels, 1, stride=stride, bias=False),
+                                          nn.BatchNorm2d(out_channels))
+
+    def forward(self, x):
+        shortcut = x if self.shortcut is None else self.shortcut(x)
+        return F.relu(self.conv2(self.conv1(x)) + shortcut)
+
+
+class SegmentationModel(nn.Module):
+    """Inputs are converted to channels last, the loss is plain cross entropy."""
+
+    channels_last = True
+
+    def prepare(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return x
+
+    def loss(self, input, target):
+        return F.cross_entropy(input, target)
+
+
+class UNet(SegmentationModel):
+
+    def __init__(self, classes=2, in_channels=3, base_channels=16, depth=4, depthwise=False):
+        SegmentationModel.__init__(self)
+        channels = [base_channels * 2**i for i in range(depth + 1)]
+        self.stem = nn.Sequential(ConvBNReLU(in_channels, channels[0]),
+                                  ConvBNReLU(channels[0], channels[0], depthwise=depthwise))
+        self.encoders = nn.ModuleList(
+            [nn.Sequential(ConvBNReLU(channels[i], channels[i + 1], stride=2, depthwise=depthwise),
+                           ConvBNReLU(channels[i + 1], channels[i + 1], depthwise=depthwise))
+             for i in range(depth)])
+        self.decoders = nn.ModuleList(
+            [nn.Sequential(ConvBNReLU(channels[i + 1] + channels[i], channels[i], depthwise=depthwise),
+                           ConvBNReLU(channels[i], channels[i], depthwise=depthwise))
+             for i in reversed(range(depth))])
+        self.classifier = nn.Conv2d(channels[0], classes, 1)
+
+    def forward(self, x):
+        x = self.stem(self.prepare(x))
+        skips = []
+        for encoder in self.encoders:
+            skips.append(x)
+            x = encoder(x)
+        for decoder, skip in zip(self.decoders, reversed(skips)):
+            x = F.interpolate(x, size=skip.shape[-2:], mode='bilinear', align_corners=False)
+            x = decoder(torch.cat([x, skip], dim=1))
+        return self.classifier(x)
+
+
+class LinkNet(SegmentationModel):
+    """skips are added instead of concatenated, which is cheaper than UNet"""
+
+    def __init__(self, classes=2, in_channels=3, base_channels=16, depth=4, depthwise=False):
+        SegmentationModel.__init__(self)
+        channels = [base_channels * 2**i for i in range(depth + 1)]
+        self.stem = ConvBNReLU(in_channels, channels[0])
+        self.encoders = nn.ModuleList(
+            [ResidualBlock(channels[i], channels[i + 1], stride=2, depthwise=depthwise)
+             for i in range(depth)])
+        self.decoders = nn.ModuleList(
+            [nn.Sequential(nn.Conv2d(channels[i + 1], channels[i], 1, bias=False),
+                           nn.BatchNorm2d(channels[i]),
+                           nn.ReLU(inplace=True))
+             for i in reversed(range(depth))])
+        self.refine = nn.ModuleList(
+            [ConvBNReLU(channels[i], channels[i], depthwise=depthwise) for i in reversed(range(depth))])
+        self.classifier = nn.Conv2d(channels[0], classes, 1)
+
+    def forward(self, x):
+        x = self.stem(self.prepare(x))
+        skips = []
+        for encoder in self.encoders:
+            skips.append(x)
+            x = encoder(x)
+        for decoder, refine, skip in zip(self.decoders, self.refine, reversed(skips)):
+            x = F.interpolate(decoder(x), size=skip.shape[-2:], mode='bilinear', align_corners=False)
+            x = refine(x + skip)
+        return self.classifier(x)
+
+
+MODELS = {'unet': UNet, 'linknet': LinkNet}
+
+
+def get_model(config):
+    if config['backbone'] not in MODELS:
+        raise Exception('unknown model ' + config['backbone'] + ', use one of ' + ', '.join(MODELS))
+    model = MODELS[config['backbone']](classes=config['classes'],
+                                       base_channels=config['base_channels'],
+                                       depth=config['depth'],
+                                       depthwise=config['depthwise'])
+    model.channels_last = config['channels_last']
+    if model.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def fuse(model):
+    """copy of the model for inference with every batch norm folded into the preceding convolution"""
+    model = copy.deepcopy(model).eval()
+    for module in model.modules():
+        names = list(module._modules.keys())
+        for first, second in zip(names, names[1:]):
+            conv = module._modules[first]
+            bn = module._modules[second]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                module._modules[first] = fuse_conv_bn_eval(conv, bn)
+                module._modules[second] = nn.Identity()
+    return model
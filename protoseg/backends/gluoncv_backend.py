@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 import os
+import math
 import numpy as np
 import cv2
 from tqdm import tqdm
@@ -13,6 +14,10 @@ from gluoncv.utils.parallel import DataParallelModel, DataParallelCriterion
 from gluoncv.data import batchify
 
 from protoseg.backends import AbstractBackend
+from protoseg.backends.__mxnet_augmentation import MXNetAugmentation
+from protoseg.checkpoint import CheckpointWriter
+from protoseg import distributed
+from protoseg import summary
 from protoseg.trainer import Trainer
 
 from mxboard import SummaryWriter
@@ -21,11 +26,14 @@ from mxboard import SummaryWriter
 class gluoncv_backend(AbstractBackend):
     ctx = mxnet.gpu()
     ctx_list = [ctx]
+    mask_dtype = 'float32'
 
     def __init__(self):
         AbstractBackend.__init__(self)
 
     def load_model(self, config, modelfile):
+        if distributed.enabled(config):
+            print('distributed training is not supported by gluoncv_backend, every process trains alone')
         model = gluoncv.model_zoo.get_model(config['backbone'], pretrained=config['pretrained'], ctx=self.ctx_list)
         model.hybridize()
         if os.path.isfile(modelfile):
@@ -33,9 +41,16 @@ class gluoncv_backend(AbstractBackend):
             model.load_parameters(modelfile, ctx=self.ctx)
         return model
 
-    def save_model(self, model):
-        model.model.module.save_parameters(model.modelfile)
-        print('saved model to:', model.modelfile)
+    def save_model(self, model, writer=None, tag=None):
+        net = model.model
+        try:
+            net = model.model.module
+        except Exception:
+            pass
+        # snapshot on cpu like Block.save_parameters, training continues while it is written
+        state = {key: value._reduce() for key, value in net._collect_params_with_prefix().items()}
+        writer = writer or CheckpointWriter(background=False)
+        writer.write(model.modelfile, lambda state, filename: mxnet.nd.save(filename, state), state, tag=tag)
 
     def init_trainer(self, trainer):
         if trainer.config['loss_function'] == 'default':
@@ -43,8 +58,13 @@ class gluoncv_backend(AbstractBackend):
         else:
             trainer.loss_function = getattr(gluoncv.loss, trainer.config['loss_function'])(
                 **trainer.config['loss_function_parameters'])
-        trainer.lr_scheduler = gluoncv.utils.LRScheduler(mode='poly', baselr=trainer.config['learn_rate'], niters=len(trainer.dataloader),
-                                                         nepochs=50)
+        accumulate_steps = trainer.config['accumulate_steps']
+        # the scheduler counts optimizer steps, the dataloader counts samples
+        steps = int(math.ceil(len(trainer.dataloader) / float(trainer.config['batch_size'] * accumulate_steps)))
+        trainer.lr_scheduler = gluoncv.utils.LRScheduler(mode='poly', baselr=trainer.config['learn_rate'],
+                                                         niters=max(1, steps), nepochs=50)
+        if accumulate_steps > 1:
+            trainer.model.model.collect_params().setattr('grad_req', 'add')
         trainer.model.model = DataParallelModel(
             trainer.model.model, self.ctx_list)
         trainer.loss_function = DataParallelCriterion(
@@ -59,6 +79,21 @@ class gluoncv_backend(AbstractBackend):
                                               'momentum': 0.9,
                                               'multi_precision': True},
                                           kvstore=kv)
+        trainer.batch_augmentation = None
+        if trainer.config['batch_augmentation']:
+            trainer.batch_augmentation = MXNetAugmentation(trainer.config)
+
+        # created once, the worker pool persists between epochs
+        trainer.train_loader = self.data_loader(trainer.config, trainer.dataloader, last_batch='rollover')
+        trainer.val_loader = None
+        if trainer.valdataloader:
+            trainer.val_loader = self.data_loader(trainer.config, trainer.valdataloader, last_batch='keep')
+
+    def data_loader(self, config, dataset, last_batch):
+        return DataLoader(dataset=dataset, batch_size=config['batch_size'], last_batch=last_batch,
+                          num_workers=config['num_workers'],
+                          pin_memory=config['pin_memory'] and self.ctx.device_type == 'gpu',
+                          prefetch=config['num_workers'] * config['prefetch_factor'])
 
     def dataloader_format(self, img, mask=None):
         if img.ndim == 2:
@@ -72,51 +107,75 @@ class gluoncv_backend(AbstractBackend):
         mask[mask > 0] = 1  # binary mask
         return mxnet.nd.array(img), mxnet.nd.array(mask)
 
+    def batch_format(self, img_batch, mask_batch=None):
+        if mask_batch is None:
+            return mxnet.nd.array(img_batch, dtype=img_batch.dtype)
+        return mxnet.nd.array(img_batch, dtype=img_batch.dtype), mxnet.nd.array(mask_batch)
+
     def train_epoch(self, trainer):
         print('train on gluoncv backend')
         batch_size = trainer.config['batch_size']
         summarysteps = trainer.config['summarysteps']
 
-        dataloader = DataLoader(
-            dataset=trainer.dataloader, batch_size=batch_size, last_batch='rollover', num_workers=batch_size)
+        dataloader = trainer.train_loader
+
+        accumulate_steps = trainer.config['accumulate_steps']
+        micro_batches = 0
+        # summed on the device, read back only at summary steps
+        epoch_loss = mxnet.nd.zeros((1,), ctx=self.ctx)
 
         for i, (X_batch, y_batch) in tqdm(enumerate(dataloader), total=len(trainer.dataloader)/batch_size):
             trainer.global_step += 1
-            trainer.lr_scheduler.update(i, trainer.epoch)
+            trainer.lr_scheduler.update(i // accumulate_steps, trainer.epoch)
+            if trainer.batch_augmentation:
+                X_batch, y_batch = trainer.batch_augmentation(X_batch, y_batch)
             X_batch = X_batch.as_in_context(self.ctx)
             y_batch = y_batch.as_in_context(self.ctx)
             with autograd.record(True):
                 outputs = trainer.model.model(X_batch)
                 losses = trainer.loss_function(outputs, y_batch)
-                mxnet.nd.waitall()
                 autograd.backward(losses)
-            trainer.optimizer.step(batch_size)
+            micro_batches += 1
+            if micro_batches == accumulate_steps:
+                self.optimizer_step(trainer, batch_size * micro_batches)
+                micro_batches = 0
             for loss in losses:
-                trainer.loss += loss.asnumpy()[0]
+                epoch_loss += loss.reshape((-1,))[:1].as_in_context(self.ctx)
             if i % summarysteps == 0:
-                tqdm.write("{}/{}, loss: {}".format(i, trainer.global_step, losses[0].asnumpy()[0]))
+                trainer.loss += epoch_loss.asscalar()
+                epoch_loss[:] = 0
+                loss_value = losses[0].asnumpy()[0]
+                tqdm.write("{}/{}, loss: {}".format(i, trainer.global_step, loss_value))
                 if trainer.summarywriter:
                     trainer.summarywriter.add_scalar(
-                        tag=trainer.name+'loss', value=losses[0].asnumpy()[0], global_step=trainer.global_step)
+                        tag=trainer.name+'loss', value=loss_value, global_step=trainer.global_step)
                     trainer.summarywriter.add_image(
                         trainer.name+"image", (X_batch[0]/255.0), global_step=trainer.global_step)
                     trainer.summarywriter.add_image(
                         trainer.name+"mask", (y_batch[0]), global_step=trainer.global_step)
                     output, _ = outputs[0]
-                    predict = mxnet.nd.argmax(
-                        output, 1).asnumpy().clip(0, 1)[0]
-                    trainer.summarywriter.add_image(
-                        trainer.name+"predicted", (predict), global_step=trainer.global_step)
+                    # argmax and host copy of the first sample only if the image is logged
+                    summary.add_image(trainer.summarywriter, trainer.name+"predicted",
+                                      lambda: mxnet.nd.argmax(output[0], 0).clip(0, 1),
+                                      global_step=trainer.global_step)
+
+        if micro_batches > 0:
+            self.optimizer_step(trainer, batch_size * micro_batches)
+        trainer.loss += epoch_loss.asscalar()
+
+    def optimizer_step(self, trainer, batch_size):
+        """update with the summed gradients of batch_size samples"""
+        trainer.optimizer.step(batch_size)
+        if trainer.config['accumulate_steps'] > 1:
+            trainer.model.model.module.collect_params().zero_grad()
 
     def validate_epoch(self, trainer):
-        batch_size = trainer.config['batch_size']
-        dataloader = DataLoader(
-            dataset=trainer.valdataloader, batch_size=batch_size, last_batch='rollover', num_workers=batch_size)
+        dataloader = trainer.val_loader
+        # every sample is scored, the trainer logs the metrices of the epoch
         for i, (X_batch, y_batch) in enumerate(dataloader):
             prediction = self.batch_predict(trainer, X_batch)
-            trainer.metric(
-                prediction[0], y_batch[0].asnumpy(), prefix=trainer.name)
-            if trainer.summarywriter:
+            trainer.metric.update(prediction, y_batch.asnumpy())
+            if i == 0 and trainer.summarywriter:
                 trainer.summarywriter.add_image(
                     trainer.name+"val_image", (X_batch[0]/255.0), global_step=trainer.epoch)
                 trainer.summarywriter.add_image(
@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+import os
+import numpy as np
+import cv2
+import onnxruntime
+
+from protoseg.backends import AbstractBackend
+
+
+class onnxruntime_backend(AbstractBackend):
+    """Inference only backend running the onnx export of a trained model.
+
+    The session is created once in load_model. Outputs are written into
+    preallocated buffers which are bound once per input shape.
+    """
+    mask_dtype = 'int64'
+    bindings = {}  # io binding and output buffer by session and input shape
+
+    def __init__(self):
+        AbstractBackend.__init__(self)
+
+    def load_model(self, config, modelfile):
+        onnxfile = os.path.splitext(modelfile)[0] + ".onnx"
+        if not os.path.isfile(onnxfile):
+            raise Exception('onnx model does not exist: ' + onnxfile)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime choose the number of threads
+        options.intra_op_num_threads = config.get('intra_op_threads', 0)
+        options.inter_op_num_threads = config.get('inter_op_threads', 0)
+        if config.get('inter_op_threads', 0) > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        session = onnxruntime.InferenceSession(
+            onnxfile, sess_options=options, providers=['CPUExecutionProvider'])
+        print('loaded model from:', onnxfile)
+        self.bindings = {}
+        return session
+
+    def save_model(self, model, writer=None, tag=None):
+        raise Exception('onnxruntime_backend supports inference only')
+
+    def init_trainer(self, trainer):
+        raise Exception('onnxruntime_backend supports inference only')
+
+    def train_epoch(self, trainer):
+        raise Exception('onnxruntime_backend supports inference only')
+
+    def validate_epoch(self, trainer):
+        raise Exception('onnxruntime_backend supports inference only')
+
+    def dataloader_format(self, img, mask=None):
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        img = np.transpose(img, axes=[2, 0, 1]).astype(np.float32)
+        if mask is None:
+            return img
+        if mask.ndim == 3:
+            mask = cv2.cvtColor(mask, cv2.COLOR_RGB2GRAY)
+        mask[mask > 0] = 1  # binary mask
+        return img, mask.astype(np.int64)
+
+    def binding(self, session, shape):
+        """io binding with a preallocated output buffer for inputs of shape"""
+        key = (id(session), shape)
+        if key not in self.bindings:
+            input_name = session.get_inputs()[0].name
+            output_name = session.get_outputs()[0].name
+            # the output shape of dynamic axes is known after a first run
+            output = session.run([output_name], {input_name: np.zeros(shape, dtype=np.float32)})[0]
+            buffer = np.empty(output.shape, dtype=np.float32)
+            binding = session.io_binding()
+            binding.bind_output(output_name, 'cpu', 0, np.float32, buffer.shape, buffer.ctypes.data)
+            self.bindings[key] = (input_name, binding, buffer)
+        return self.bindings[key]
+
+    def predict(self, predictor, img):
+        """mask of one image, uint8 so it can be resized with cv2"""
+        img_batch = [img]
+        return self.batch_predict(predictor, img_batch)[0].astype(np.uint8)
+
+    def batch_predict(self, predictor, img_batch):
+        session = predictor.model.model
+        images = np.ascontiguousarray(np.asarray(img_batch), dtype=np.float32)
+        input_name, binding, buffer = self.binding(session, images.shape)
+        binding.bind_cpu_input(input_name, images)
+        session.run_with_iobinding(binding)
+        return buffer.argmax(1)
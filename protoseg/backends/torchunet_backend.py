@@ -0,0 +1,51 @@
+from __future__ import absolute_import
+import os
+import numpy as np
+import torch
+
+from protoseg.backends.__torch_backend import TorchBackend
+from protoseg.backends.__torch_unet import get_model, fuse
+
+
+class torchunet_backend(TorchBackend):
+    """Compact UNet and LinkNet models in plain torch, designed for CPUs.
+
+    Training, checkpoints, summaries and export are those of TorchBackend, the
+    loss is the one of the model.
+    Inference runs a copy of the model with batch norms folded into the convolutions.
+    """
+    fused = None  # model and its fused copy
+
+    def load_model(self, config, modelfile):
+        model = get_model(config).to(self.device)
+        if os.path.isfile(modelfile):
+            print('loaded model from:', modelfile)
+            model.load_state_dict(torch.load(modelfile, map_location=self.device)["model_state"])
+        self.fused = None
+        return self.parallel_model(config, model)
+
+    def train_epoch(self, trainer):
+        TorchBackend.train_epoch(self, trainer)
+        # the fused copy is stale after training
+        if self.fused:
+            self.fused = (None, self.fused[1])
+
+    def batch_predict(self, predictor, img_batch):
+        model = predictor.model.model
+        try:
+            model = model.module
+        except Exception:
+            pass
+        if self.fused is None or self.fused[0] is not model:
+            if self.fused:
+                # compiled forwards of the old copy
+                self.compiled = {key: function for key, function in self.compiled.items()
+                                 if key[0] != id(self.fused[1])}
+            self.fused = (model, fuse(model))
+        if not torch.is_tensor(img_batch):
+            img_batch = torch.from_numpy(np.stack(img_batch))
+        images = img_batch.to(self.device)
+        with torch.no_grad(), self.autocast(predictor.config):
+            outputs = self.forward(self.fused[1], images, predictor.config)
+        pred = outputs.float().max(1)[1].cpu().numpy()
+        return pred
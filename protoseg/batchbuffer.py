@@ -0,0 +1,65 @@
+import numpy as np
+import cv2
+
+
+class BatchBuffer():
+    """Ring of preallocated NCHW image and mask batches.
+
+    Batches handed out by fill are views into the ring and stay valid
+    until the ring wraps around.
+    """
+
+    current = 0
+
+    def __init__(self, size=2, dtype='float32', mask_dtype='int64'):
+        self.size = max(size, 1)
+        self.dtype = np.dtype(dtype)
+        self.mask_dtype = np.dtype(mask_dtype)
+        self.ring = []
+
+    def allocate(self, batch_size, img, mask=None):
+        # gray images are expanded to three channels like dataloader_format does
+        channels = 3 if img.ndim == 2 else img.shape[2]
+        shape = (batch_size, channels) + img.shape[:2]
+        self.ring = []
+        for _ in range(self.size):
+            images = np.empty(shape, dtype=self.dtype)
+            masks = None
+            if mask is not None:
+                masks = np.empty((batch_size,) + mask.shape[:2], dtype=self.mask_dtype)
+            self.ring.append((images, masks))
+        self.current = 0
+
+    def fits(self, batch_size, img, mask=None):
+        if not self.ring:
+            return False
+        images, masks = self.ring[0]
+        if images.shape[0] < batch_size or images.shape[2:] != img.shape[:2]:
+            return False
+        if mask is None:
+            return True
+        return masks is not None and masks.shape[1:] == mask.shape[:2]
+
+    def fill(self, samples):
+        """copies a list of (img, mask) samples into the next batch of the ring"""
+        batch_size = len(samples)
+        img, mask = samples[0]
+        if not self.fits(batch_size, img, mask):
+            self.allocate(batch_size, img, mask)
+        images, masks = self.ring[self.current]
+        self.current = (self.current + 1) % self.size
+
+        for i, (img, mask) in enumerate(samples):
+            if img.ndim == 2:
+                images[i] = img
+            else:
+                images[i] = img.transpose(2, 0, 1)
+            if mask is None:
+                continue
+            if mask.ndim == 3:
+                mask = cv2.cvtColor(mask, cv2.COLOR_RGB2GRAY)
+            # binary mask
+            np.minimum(mask, 1, out=masks[i], casting='unsafe')
+        if masks is None:
+            return images[:batch_size], None
+        return images[:batch_size], masks[:batch_size]
@@ -0,0 +1,171 @@
+import os
+import copy
+import json
+import tempfile
+import shutil
+from timeit import default_timer as timer
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from . import archive
+from . import backends
+from .augmentation import Augmentation
+from .dataloader import DataLoader
+
+
+def synthetic_dataset(path, samples=100, width=512, height=512, seed=0):
+    """writes random JPEG images and PNG masks with ellipses into path/train and path/train_masks"""
+    random_state = np.random.RandomState(seed)
+    image_dir = os.path.join(path, 'train')
+    masks_dir = os.path.join(path, 'train_masks')
+    for folder in [image_dir, masks_dir]:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+    for i in range(samples):
+        img = random_state.randint(0, 256, (height, width, 3)).astype(np.uint8)
+        img = cv2.GaussianBlur(img, (9, 9), 0)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        if i % 2 == 0:
+            center = (int(random_state.randint(width)), int(random_state.randint(height)))
+            axes = (int(random_state.randint(5, width // 4)), int(random_state.randint(5, height // 4)))
+            cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+            img[mask > 0] = img[mask > 0] // 2
+        cv2.imwrite(os.path.join(image_dir, '{:06d}.jpg'.format(i)), img)
+        cv2.imwrite(os.path.join(masks_dir, '{:06d}_mask.png'.format(i)), mask)
+
+
+# methods of DataLoader.sample and its augmentation which are timed as stages
+LOADER_STAGES = ['read', 'resize_margin', 'augment_geometry', 'crop_margin', 'resize']
+AUGMENTATION_STAGES = ['random_flip', 'random_rotation', 'random_shift', 'random_zoom',
+                       'random_geometry', 'shape_augmentation', 'random_noise',
+                       'random_brightness', 'random_contrast', 'img_augmentation']
+
+
+def percentiles(times):
+    times = np.array(times) * 1000.0
+    return {'mean_ms': float(np.mean(times)),
+            'p50_ms': float(np.percentile(times, 50)),
+            'p90_ms': float(np.percentile(times, 90)),
+            'p99_ms': float(np.percentile(times, 99))}
+
+
+class Benchmark():
+    """Measures samples/sec and latency of every stage of DataLoader.sample.
+
+    Without datapath a synthetic dataset of orig_width x orig_height images is generated.
+    """
+
+    def __init__(self, config, samples=100, datapath=None):
+        self.config = copy.deepcopy(config)
+        self.samples = samples
+        self.datapath = datapath
+        self.times = {}
+
+    def record(self, stage, start):
+        self.times.setdefault(stage, []).append(timer() - start)
+        return timer()
+
+    def timed(self, function, stage):
+        def call(*args, **kwargs):
+            start = timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, start)
+        return call
+
+    def hook(self, owner, name):
+        """times every call of owner.name, returns a function which removes the hook"""
+        function = getattr(owner, name)
+        shadowed = name in vars(owner)
+        setattr(owner, name, self.timed(function, name))
+
+        def unhook():
+            if shadowed:
+                setattr(owner, name, function)
+            else:
+                delattr(owner, name)
+        return unhook
+
+    def stages(self, loader, index):
+        """runs DataLoader.sample with timing hooks on the methods it calls,
+        nested stages like augment_geometry include their inner stages"""
+        unhooks = [self.hook(archive, 'imread')]
+        for name in LOADER_STAGES:
+            unhooks.append(self.hook(loader, name))
+        if loader.augmentation:
+            for name in AUGMENTATION_STAGES:
+                unhooks.append(self.hook(loader.augmentation, name))
+        filters = loader.filters
+        loader.filters = [dict(f, function=self.timed(f['function'], 'filter ' + f['function'].__name__))
+                          for f in filters]
+        try:
+            begin = timer()
+            img, mask = loader.sample(index)
+            if backends.backend():
+                start = timer()
+                backends.backend().dataloader_format(img, mask)
+                self.record('dataloader_format', start)
+            self.record('total', begin)
+        finally:
+            loader.filters = filters
+            for unhook in reversed(unhooks):
+                unhook()
+
+    def run(self):
+        tmpdir = None
+        datapath = self.datapath
+        if datapath is None:
+            tmpdir = tempfile.mkdtemp(prefix='protoseg_benchmark_')
+            print('generating synthetic dataset in', tmpdir)
+            synthetic_dataset(tmpdir, samples=self.samples,
+                              width=self.config['orig_width'], height=self.config['orig_height'])
+            datapath = tmpdir
+            self.config['manifest'] = None
+        self.config['datapath'] = datapath
+        self.times = {}
+        try:
+            augmentation = Augmentation(config=self.config)
+            loader = DataLoader(config=self.config, mode='train', augmentation=augmentation)
+            samples = min(self.samples, len(loader))
+            for index in tqdm(range(samples)):
+                self.stages(loader, index)
+
+            # end to end, including prefetching and the sample cache
+            start = timer()
+            if backends.backend():
+                for i, _ in enumerate(loader.generator()):
+                    if i + 1 >= samples:
+                        break
+            else:
+                for index in range(samples):
+                    loader.sample(index)
+            elapsed = timer() - start
+        finally:
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        return {'samples': samples,
+                'samples_per_sec': samples / elapsed,
+                'stages': {stage: percentiles(times) for stage, times in self.times.items()}}
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('saved benchmark to:', path)
+
+
+def compare(results, baseline):
+    """prints the ratio of stage latencies and throughput to a previous benchmark"""
+    for run in results:
+        if run not in baseline:
+            continue
+        print(run, 'samples/sec: {:.1f} (was {:.1f})'.format(
+            results[run]['samples_per_sec'], baseline[run]['samples_per_sec']))
+        for stage, values in sorted(results[run]['stages'].items()):
+            old = baseline[run]['stages'].get(stage)
+            if old and old['p50_ms'] > 0:
+                print('  {:<24} p50 {:8.3f} ms  x{:.2f}'.format(
+                    stage, values['p50_ms'], values['p50_ms'] / old['p50_ms']))
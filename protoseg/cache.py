@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+def cache_key(config, files):
+    """Hash of the file list and all config keys which change decoded samples."""
+    keys = ['filters', 'width', 'height', 'mask_width', 'mask_height',
+            'gray_img', 'color_img', 'gray_mask', 'color_mask',
+            'reduced_decode', 'orig_width', 'orig_height']
+    description = {'files': list(files),
+                   'config': {key: config.get(key) for key in keys}}
+    description = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+class SampleCache():
+    """Memory mapped store of filtered and resized uint8 images and masks.
+
+    Samples are written on first access, so the first epoch fills the cache
+    and every following epoch reads from the mapped files.
+    """
+
+    images = None
+    masks = None
+    filled = None
+
+    def __init__(self, path, key, length):
+        self.path = os.path.join(path, key)
+        self.length = length
+        if os.path.isfile(self.filename('filled')):
+            self.open()
+
+    def filename(self, name):
+        return os.path.join(self.path, name + '.npy')
+
+    def open(self):
+        self.filled = open_memmap(self.filename('filled'), mode='r+')
+        self.images = open_memmap(self.filename('images'), mode='r+')
+        if os.path.isfile(self.filename('masks')):
+            self.masks = open_memmap(self.filename('masks'), mode='r+')
+
+    def create(self, img, mask=None, timeout=600):
+        """allocate the store with shape and dtype of the given sample,
+        concurrent processes like distributed ranks wait for the one holding the lock file"""
+        os.makedirs(self.path, exist_ok=True)
+        lockfile = os.path.join(self.path, 'create.lock')
+        try:
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self.wait(lockfile, timeout)
+            return
+        try:
+            # another process may have finished the store before the lock was taken
+            if os.path.isfile(self.filename('filled')):
+                self.open()
+            if not self.matches(img, mask):
+                self.allocate(img, mask)
+        finally:
+            os.close(fd)
+            os.remove(lockfile)
+        self.open()
+
+    def wait(self, lockfile, timeout):
+        start = time.time()
+        while not os.path.isfile(self.filename('filled')):
+            if time.time() - start > timeout:
+                raise Exception('sample cache is locked, remove stale lock file ' + lockfile)
+            time.sleep(0.1)
+        self.open()
+
+    def matches(self, img, mask=None):
+        """True if the store holds samples of the shape and dtype of img and mask"""
+        if not self.ready():
+            return False
+        if self.images.dtype != img.dtype or self.images.shape != (self.length,) + img.shape:
+            return False
+        if mask is None:
+            return self.masks is None
+        return (self.masks is not None and self.masks.dtype == mask.dtype
+                and self.masks.shape == (self.length,) + mask.shape)
+
+    def allocate(self, img, mask=None):
+        # a stale store is dropped, waiting processes see no filled flags until it is rebuilt
+        self.images = self.masks = self.filled = None
+        for name in ['filled', 'masks']:
+            if os.path.isfile(self.filename(name)):
+                os.remove(self.filename(name))
+        self.images = open_memmap(self.filename('images'), mode='w+',
+                                  dtype=img.dtype, shape=(self.length,) + img.shape)
+        if mask is not None:
+            self.masks = open_memmap(self.filename('masks'), mode='w+',
+                                     dtype=mask.dtype, shape=(self.length,) + mask.shape)
+        # the filled flags are written last, they mark a complete store
+        tmpfile = os.path.join(self.path, 'filled.tmp.npy')
+        filled = open_memmap(tmpfile, mode='w+', dtype=np.uint8,
+                             shape=(self.length,))
+        del filled
+        os.replace(tmpfile, self.filename('filled'))
+
+    def ready(self):
+        return self.filled is not None
+
+    def __contains__(self, index):
+        return self.ready() and bool(self.filled[index])
+
+    def __getitem__(self, index):
+        # copies protect the store from in-place modifications
+        img = np.array(self.images[index])
+        if self.masks is None:
+            return img, None
+        return img, np.array(self.masks[index])
+
+    def __setitem__(self, index, sample):
+        img, mask = sample
+        if img.shape != self.images.shape[1:]:
+            return
+        if mask is not None and mask.shape != self.masks.shape[1:]:
+            return
+        self.images[index] = img
+        if mask is not None:
+            self.masks[index] = mask
+        self.filled[index] = 1
@@ -0,0 +1,78 @@
+import os
+import glob
+import queue
+import shutil
+import threading
+
+
+def write_checkpoint(path, save, state, keep=0, tag=None):
+    """save(state, filename) to a temporary file which replaces path,
+    with keep > 0 also a copy path.<tag> is stored and only the last keep copies are kept"""
+    tmpfile = path + '.tmp'
+    save(state, tmpfile)
+    os.replace(tmpfile, path)
+    print('saved model to:', path)
+    if keep <= 0 or tag is None:
+        return
+    copy = '{}.{}'.format(path, tag)
+    try:
+        if os.path.exists(copy):
+            os.remove(copy)
+        os.link(path, copy)
+    except OSError:
+        shutil.copyfile(path, copy)
+    copies = sorted(glob.glob(glob.escape(path) + '.*'), key=os.path.getmtime)
+    copies = [c for c in copies if c != tmpfile]
+    for old in copies[:-keep]:
+        os.remove(old)
+
+
+class CheckpointWriter():
+    """Writes checkpoint snapshots in a background thread.
+
+    The backend snapshots the state in memory, so training continues while
+    the snapshot is serialized. At most queue_size snapshots wait for writing.
+    """
+
+    thread = None
+
+    def __init__(self, keep=0, background=True, queue_size=1):
+        self.keep = keep
+        self.background = background
+        self.queue = queue.Queue(maxsize=queue_size)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    break
+                write_checkpoint(*task)
+            except Exception as e:
+                print('writing checkpoint failed:', e)
+            finally:
+                self.queue.task_done()
+
+    def write(self, path, save, state, tag=None):
+        if not self.background:
+            write_checkpoint(path, save, state, self.keep, tag)
+            return
+        self.start()
+        self.queue.put((path, save, state, self.keep, tag))
+
+    def flush(self):
+        """blocks until all snapshots are written"""
+        if self.thread:
+            self.queue.join()
+
+    def close(self):
+        if self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
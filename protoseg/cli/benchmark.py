@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+from protoseg import Config
+from protoseg import backends
+from protoseg.benchmark import Benchmark, compare, save
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument('--config', help="Path to config file.")
+    parser.add_argument('--samples', type=int, default=100, help="Number of samples.")
+    parser.add_argument('--datapath', help="Use this data instead of a synthetic dataset.")
+    parser.add_argument('--output', default='results/benchmark.json', help="Result file.")
+    parser.add_argument('--compare', help="Previous result file to compare with.")
+
+    args, _ = parser.parse_known_args()
+
+    configfile = args.config or {'run1': {}}
+    configs = Config(configfile)
+    results = {}
+    for run in configs:
+        print("Benchmark: ", run)
+        config = configs.get()
+        try:
+            backends.set_backend(config['backend'])
+        except Exception as e:
+            # decoding and augmentation are measured without backend
+            print(e)
+        benchmark = Benchmark(config, samples=args.samples, datapath=args.datapath)
+        results[run] = benchmark.run()
+        print('samples/sec: {:.1f}'.format(results[run]['samples_per_sec']))
+        for stage, values in sorted(results[run]['stages'].items()):
+            print('  {:<24} p50 {:8.3f} ms  p90 {:8.3f} ms  p99 {:8.3f} ms'.format(
+                stage, values['p50_ms'], values['p90_ms'], values['p99_ms']))
+
+    if os.path.dirname(args.output) and not os.path.exists(os.path.dirname(args.output)):
+        os.makedirs(os.path.dirname(args.output))
+    save(results, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
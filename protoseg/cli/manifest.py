@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from protoseg.manifest import Manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument('--datapath', default='data/', help="Path to data folder.")
+    parser.add_argument('--output', default='manifest.json',
+                        help="Manifest file name, relative to datapath.")
+    parser.add_argument('--val', type=float, default=0,
+                        help="Part of train to move into the val subset.")
+    parser.add_argument('--skip-sizes', action='store_true',
+                        help="Do not decode images to store their sizes.")
+
+    args, _ = parser.parse_known_args()
+
+    # rescans start from an empty manifest, ids are never appended twice
+    manifest = Manifest(os.path.join(os.path.expanduser(args.datapath), args.output), load=False)
+    for subset in ['train', 'val', 'test']:
+        if os.path.isdir(os.path.join(manifest.root, subset)):
+            manifest.scan(subset)
+    if args.val > 0:
+        manifest.split('train', args.val)
+    if not args.skip_sizes:
+        manifest.compute_sizes()
+    for subset in manifest.subsets:
+        print(subset, len(manifest.subsets[subset]))
+    manifest.save()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@ from protoseg import Model
 from protoseg import Trainer
 from protoseg import Report
 from protoseg import backends
+from protoseg import distributed
 
 resultspath = 'results/'
 
@@ -27,15 +28,18 @@ def main():
     for run in configs:
         print("Run: ", run)
         resultpath = os.path.join(resultspath, run)
-        if not os.path.exists(resultpath):
-            os.makedirs(resultpath)
-        configs.save(resultpath + '/config.yml')
+        # every rank creates the folder
+        os.makedirs(resultpath, exist_ok=True)
+        if distributed.is_main():
+            configs.save(resultpath + '/config.yml')
         # get config for current run
         config = configs.get()
         # set backend
         backends.set_backend(config['backend'])
         # summary
-        summarywriter = backends.backend().get_summary_writer(logdir=resultpath)
+        summarywriter = None
+        if distributed.is_main():
+            summarywriter = backends.backend().get_summary_writer(logdir=resultpath)
         # Load Model
         modelfile = os.path.join('results/', run, 'model.checkpoint')
         model = Model(config, modelfile)
@@ -48,8 +52,9 @@ def main():
         trainer = Trainer(config, model, dataloader, valdataloader=valdataloader, summarywriter=summarywriter)
         trainer.train()
     
-    report = Report(configs, resultspath)
-    report.generate()
+    if distributed.is_main():
+        report = Report(configs, resultspath)
+        report.generate()
     sys.exit(0)
 
 
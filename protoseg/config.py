@@ -6,15 +6,28 @@ class Config():
     keys = []
     current = -1
 
-    default = {'datapath': 'data/',
+    default = {'datapath': 'data/', 'manifest': None,
                'backend': 'gluoncv_backend', 'backbone': 'resnet50',
                'ignore_unlabeled': False,
                'batch_size': 1, 'learn_rate': 1.0, 'epochs': 1, 'dropout': 0.5, # hyperparameter
+               'distributed': False,  # data parallel over torchrun processes
                'optimizer': 'sgd',
+               'accumulate_steps': 1,  # micro batches per optimizer step
                'loss_function': 'default', 'loss_function_parameters': {},
+               'precision': 'float32',  # float32 or bfloat16 autocast
+               'compile': False,  # False, trace or compile
+               'async_checkpoint': True, 'checkpoint_keep': 0,  # checkpoints per epoch to keep
+               'export_onnx': True,  # after training if the checkpoint changed
+               'intra_op_threads': 0, 'inter_op_threads': 0,  # onnxruntime, 0 is automatic
+               'base_channels': 16, 'depth': 4,  # torchunet models
+               'depthwise': False, 'channels_last': True,
                'pretrained': False, 'summarysteps': 100, 'classes': 2,
+               'async_summary': True, 'summary_queue': 64,  # summaries written in a thread
+               'summary_scalar_interval': 0.0, 'summary_image_interval': 10.0,  # seconds per tag
+               'summary_image_size': 256,
                'width': 480, 'height': 480,
                'orig_width': 512, 'orig_height': 512,
+               'reduced_decode': False,  # decode at reduced JPEG scale
                'gray_img': False, 'gray_mask': False,
                'color_img': False, 'color_mask': False,
                'flip': False, 'horizontal_flip': True,
@@ -23,8 +36,19 @@ class Config():
                'noise_amount': 0, 'noise_chance': 0,
                'min_val': 0, 'max_val': 255,  # pixel values
                'min_bright': -20, 'max_bright': +30,  # brightness
+               'min_contrast': 1.0, 'max_contrast': 1.0,  # contrast
                'zoom_in': 0, 'zoom_out': 0,  # zoom
+               'fused_geometry': False,  # flip, rotation, shift and zoom in one warp
+               'augmentation_order': 'augment_first', 'resize_margin': 0,
+               'batch_augmentation': False,  # augment collated batches in the backend
                'img_augmentation': [],'shape_augmentation': [], 'filters': [],
+               'cache': False, 'cachepath': None,  # decoded sample cache
+               'num_workers': 1, 'prefetch_factor': 2,  # backend loaders
+               'pin_memory': True, 'persistent_workers': True, 'worker_affinity': False,
+               'num_threads': 0,  # torch intra-op threads, 0 is automatic
+               'prefetch_workers': 0, 'prefetch_queue': 8, 'prefetch_ordered': True,
+               'seed': None,
+               'batch_buffers': 0, 'batch_dtype': 'float32',  # preallocated batches
                'hyperparamopt': []
                }
 
@@ -1,17 +1,36 @@
 
 import os
+import random
 from os.path import expanduser
 from importlib import import_module
 import numpy as np
 import cv2
+from . import archive
 from . import backends
-from tqdm import tqdm
+from .cache import SampleCache, cache_key
+from .maskindex import MaskIndex
+from .manifest import Manifest
+from .batchbuffer import BatchBuffer
+from .prefetch import Prefetcher
+
+REDUCED_GRAYSCALE = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                     4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                     8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+REDUCED_COLOR = {2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
 
 class DataLoader():
 
     current = 0
+    reduction = 1
+    source_size = None
     images = []
     masks = []
+    cache = None
+    buffer = None
+    epoch = 0  # number of prefetched passes
 
     def __init__(self, config=None, mode='train', augmentation=None):
         self.config = config
@@ -23,23 +42,24 @@ class DataLoader():
         _image_dir = os.path.join(self.root, mode)
         _masks_dir = os.path.join(self.root, mode + "_masks")
 
-        self.images = (os.path.join(_image_dir, f)
-                       for f in os.listdir(_image_dir) if "mask" not in f)
-        self.images = sorted(self.images)
+        if config['manifest']:
+            self.load_manifest(os.path.join(self.root, expanduser(config['manifest'])))
+        else:
+            self.images = (os.path.join(_image_dir, f)
+                           for f in os.listdir(_image_dir) if "mask" not in f)
+            self.images = sorted(self.images)
+
+        if config['manifest']:
+            # archive indices are built once, before any worker is forked
+            archive.prepare(self.images + (self.masks if mode != 'test' else []))
 
         if mode != 'test':
-            self.masks = (os.path.join(_masks_dir, f)
-                          for f in os.listdir(_masks_dir))
-            self.masks = sorted(self.masks)
+            if not config['manifest']:
+                self.masks = (os.path.join(_masks_dir, f)
+                              for f in os.listdir(_masks_dir))
+                self.masks = sorted(self.masks)
             if config['ignore_unlabeled'] is True:
-                i = 0
-                for _ in tqdm(range(len(self.masks))):
-                    mask = cv2.imread(self.masks[i], cv2.IMREAD_GRAYSCALE)
-                    if np.sum(mask) == 0:
-                        del self.images[i]
-                        del self.masks[i]
-                    else:
-                        i += 1
+                self.remove_unlabeled()
 
         if mode != 'test':
             assert (len(self.images) == len(self.masks))
@@ -58,6 +78,65 @@ class DataLoader():
                 self.filters.append(
                     {'function': met, 'parameters': parameters})
 
+        if self.config['reduced_decode']:
+            self.reduction = self.decode_reduction()
+            print('decode at 1/{} scale'.format(self.reduction))
+
+        if self.config['cache']:
+            self.init_cache()
+
+    def decode_reduction(self):
+        """largest JPEG DCT scale factor which keeps the decoded image at least as
+        large as the image and mask training sizes plus the zoom and resize margins,
+        source sizes are taken from the manifest if known"""
+        if not (self.config['gray_img'] or self.config['color_img']):
+            return 1
+        margin = 1.0
+        if self.augmentation and not self.config['cache']:
+            margin += self.config['zoom_in']
+            if self.resize_first():
+                margin += self.config['resize_margin']
+        # resize() takes height as columns and width as rows
+        cols = max(self.config['height'], self.config.get('mask_height') or 0)
+        rows = max(self.config['width'], self.config.get('mask_width') or 0)
+        orig_width, orig_height = self.source_size or (
+            self.config['orig_width'], self.config['orig_height'])
+        reduction = 1
+        for factor in [2, 4, 8]:
+            if (orig_width / factor >= cols * margin and
+                    orig_height / factor >= rows * margin):
+                reduction = factor
+        return reduction
+
+    def load_manifest(self, path):
+        """takes images and masks of the subset named like mode from a manifest"""
+        assert os.path.isfile(path), 'manifest not found: ' + path
+        manifest = Manifest(path)
+        self.images = manifest.images(self.mode)
+        if self.mode != 'test':
+            self.masks = manifest.masks(self.mode)
+        self.source_size = manifest.min_size(self.mode)
+
+    def init_cache(self):
+        cachepath = self.config['cachepath'] or os.path.join(self.root, 'cache')
+        key = cache_key(self.config, self.images + self.masks)
+        self.cache = SampleCache(cachepath, key, len(self))
+        print('sample cache:', self.cache.path)
+        if len(self) > 0:
+            # create the store before any worker process is forked,
+            # a store of another sample shape or dtype is rebuilt
+            sample = self.cache_sample(0)
+            if not self.cache.matches(*sample):
+                self.cache.create(*sample)
+
+    def remove_unlabeled(self):
+        """drops samples with empty masks, statistics are kept in a sidecar index"""
+        index = MaskIndex(os.path.join(self.root, self.mode + '_masks.index.json'))
+        index.update(self.masks)
+        labeled = index.labeled(self.masks)
+        self.images = [img for img, l in zip(self.images, labeled) if l]
+        self.masks = [mask for mask, l in zip(self.masks, labeled) if l]
+
     def filter(self, img):
         for f in self.filters:
             if type(f['parameters']) is list:
@@ -66,6 +145,15 @@ class DataLoader():
                 img = f['function'](img, **f['parameters'])
         return img
 
+    def dsize(self, mask=False):
+        """cv2 output size used by resize()"""
+        width = self.config['width']
+        height = self.config['height']
+        if mask:
+            width = self.config.get('mask_width') or width
+            height = self.config.get('mask_height') or height
+        return (height, width)
+
     def resize(self, img, mask=None, width=None, height=None):
         img = cv2.resize(
             img, (height or self.config['height'],width or self.config['width']))
@@ -79,50 +167,199 @@ class DataLoader():
             mask, (height or self.config['height'], width or self.config['width']), interpolation=cv2.INTER_NEAREST)
         return img, mask
 
-    def __getitem__(self, index):
-
+    def read(self, index):
+        """read image and mask of given index and apply the filters"""
         if self.config['gray_img']:
-            img = cv2.imread(self.images[index], cv2.IMREAD_GRAYSCALE)
+            flag = REDUCED_GRAYSCALE.get(self.reduction, cv2.IMREAD_GRAYSCALE)
+            img = archive.imread(self.images[index], flag)
         elif self.config['color_img']:
-            img = cv2.imread(self.images[index], cv2.IMREAD_COLOR)
+            flag = REDUCED_COLOR.get(self.reduction, cv2.IMREAD_COLOR)
+            img = archive.imread(self.images[index], flag)
         else:
-            img = cv2.imread(self.images[index], cv2.IMREAD_UNCHANGED)
+            img = archive.imread(self.images[index], cv2.IMREAD_UNCHANGED)
 
         img = self.filter(img)
 
         if self.mode == 'test':
-            img = self.resize(img)
-            return backends.backend().dataloader_format(img), self.images[index]
+            return img, None
 
         if self.config['gray_mask']:
-            mask = cv2.imread(self.masks[index], cv2.IMREAD_GRAYSCALE)
+            mask = archive.imread(self.masks[index], cv2.IMREAD_GRAYSCALE)
         elif self.config['color_mask']:
-            mask = cv2.imread(self.masks[index], cv2.IMREAD_COLOR)
+            mask = archive.imread(self.masks[index], cv2.IMREAD_COLOR)
         else:
-            mask = cv2.imread(self.masks[index], cv2.IMREAD_UNCHANGED)
+            mask = archive.imread(self.masks[index], cv2.IMREAD_UNCHANGED)
+        if self.reduction > 1:
+            # nearest neighbour subsampling keeps the label values
+            mask = np.ascontiguousarray(
+                mask[::self.reduction, ::self.reduction])
+        return img, mask
 
-        if self.augmentation:
-            img, mask = self.augmentation.random_flip(img, mask)
-            img, mask = self.augmentation.random_rotation(img, mask)
-            img, mask = self.augmentation.random_shift(img, mask)
-            img, mask = self.augmentation.random_zoom(img, mask)
-            img, mask = self.augmentation.shape_augmentation(img, mask)
+    def cache_sample(self, index):
+        """read sample resized to image size, masks keep the image geometry
+        so augmentations stay aligned"""
+        img, mask = self.read(index)
+        img = self.resize(img)
+        if mask is not None:
+            mask = cv2.resize(mask, (img.shape[1], img.shape[0]),
+                              interpolation=cv2.INTER_NEAREST)
+        return img, mask
+
+    def load(self, index):
+        if self.cache is None:
+            return self.read(index)
+        if index in self.cache:
+            return self.cache[index]
+        img, mask = self.cache_sample(index)
+        self.cache[index] = (img, mask)
+        return img, mask
+
+    def resize_first(self):
+        return self.config['augmentation_order'] == 'resize_first'
+
+    def augmentation_scale(self, img):
+        """size of img relative to the source images, shifts are given in source pixels"""
+        if not (self.resize_first() or self.config['cache'] or self.reduction > 1):
+            return 1.0
+        orig_width, _ = self.source_size or (
+            self.config['orig_width'], self.config['orig_height'])
+        if self.resize_first():
+            # the padded margin is not part of the image
+            return self.dsize()[0] / orig_width
+        return img.shape[1] / orig_width
+
+    def resize_margin(self, img, mask):
+        """resizes image and mask to the training size and pads them by the margin,
+        so augmentations move reflected borders into view instead of black ones
+        while the field of view stays the one of the validation images"""
+        img = cv2.resize(img, self.dsize())
+        mask = cv2.resize(mask, self.dsize(), interpolation=cv2.INTER_NEAREST)
+        cols, rows = self.dsize()
+        left = int(round(cols * self.config['resize_margin'] / 2))
+        top = int(round(rows * self.config['resize_margin'] / 2))
+        if top <= 0 and left <= 0:
+            return img, mask
+        img = cv2.copyMakeBorder(img, top, top, left, left, cv2.BORDER_REFLECT_101)
+        mask = cv2.copyMakeBorder(mask, top, top, left, left, cv2.BORDER_CONSTANT, value=0)
+        return img, mask
+
+    def crop_margin(self, img, mask):
+        """crops the padding of resize_margin"""
+        cols, rows = self.dsize()
+        top = (img.shape[0] - rows) // 2
+        left = (img.shape[1] - cols) // 2
+        if top <= 0 and left <= 0:
+            return img, mask
+        return (img[top:top + rows, left:left + cols],
+                mask[top:top + rows, left:left + cols])
+
+    def augment(self, img, mask):
+        """geometric and photometric augmentation,
+        with batch_augmentation the backend augments collated batches instead"""
+        img, mask = self.augment_shape(img, mask)
+        img, mask = self.augmentation.shape_augmentation(img, mask)
+        img = self.augment_photometric(img)
+        img = self.augmentation.img_augmentation(img)
+        return img, mask
+
+    def augment_shape(self, img, mask):
+        """per sample geometry, runs before the imgaug shape sequence"""
+        if self.resize_first():
+            img, mask = self.resize_margin(img, mask)
+        if not self.config['batch_augmentation']:
+            img, mask = self.augment_geometry(img, mask)
+        return img, mask
+
+    def augment_photometric(self, img):
+        """per sample noise, brightness and contrast, runs before the imgaug image sequence"""
+        if not self.config['batch_augmentation']:
             img = self.augmentation.random_noise(img)
             img = self.augmentation.random_brightness(img)
+            img = self.augmentation.random_contrast(img)
+        return img
+
+    def augment_geometry(self, img, mask):
+        scale = self.augmentation_scale(img)
+        if self.config['fused_geometry']:
+            if self.resize_first():
+                return self.augmentation.random_geometry(img, mask, scale=scale)
+            return self.augmentation.random_geometry(
+                img, mask, self.dsize(), self.dsize(mask=True), scale=scale)
+        img, mask = self.augmentation.random_flip(img, mask)
+        img, mask = self.augmentation.random_rotation(img, mask)
+        img, mask = self.augmentation.random_shift(img, mask, scale=scale)
+        return self.augmentation.random_zoom(img, mask)
+
+    def sample(self, index):
+        """augmented and resized image and mask of given index as numpy arrays"""
+        img, mask = self.load(index)
+
+        if self.mode == 'test':
+            return self.resize(img), None
+
+        if self.augmentation:
+            img, mask = self.augment(img, mask)
+            if self.resize_first():
+                img, mask = self.crop_margin(img, mask)
 
-            img = self.augmentation.img_augmentation(img)
+        return self.resize(img, mask)
 
-        img, mask = self.resize(img, mask)
+    def samples(self, indices):
+        """sample() for a list of indices, imgaug runs once for the whole batch"""
+        if self.mode == 'test' or not self.augmentation:
+            return [self.sample(index) for index in indices]
+        # same order as augment: geometry, imgaug shape, photometric, imgaug image
+        batch = [self.augment_shape(*self.load(index)) for index in indices]
+        images, masks = self.augmentation.augment_batch(
+            [img for img, _ in batch], [mask for _, mask in batch], image=False)
+        images = [self.augment_photometric(img) for img in images]
+        images, _ = self.augmentation.augment_batch(images, shape=False)
+        if self.resize_first():
+            batch = [self.crop_margin(img, mask) for img, mask in zip(images, masks)]
+            images, masks = zip(*batch)
+        return [self.resize(img, mask) for img, mask in zip(images, masks)]
+
+    def batch(self, indices):
+        """backend formatted samples of a list of indices"""
+        backend = backends.backend()
+        return [backend.dataloader_format(img, mask) for img, mask in self.samples(indices)]
+
+    def __getitem__(self, index):
+        img, mask = self.sample(index)
+
+        if self.mode == 'test':
+            return backends.backend().dataloader_format(img), self.images[index]
 
         return backends.backend().dataloader_format(img, mask)
 
     def __len__(self):
         return len(self.images)
 
+    def reseed(self, seed):
+        """seeds the random generators, used for worker processes"""
+        random.seed(seed)
+        np.random.seed(seed % 2**32)
+        if self.augmentation:
+            self.augmentation.reseed(seed)
+
+    def prefetch(self, tasks, function='__getitem__', batched=False):
+        prefetcher = Prefetcher(self, function=function, batched=batched,
+                                workers=self.config['prefetch_workers'],
+                                queue_size=self.config['prefetch_queue'],
+                                ordered=self.config['prefetch_ordered'],
+                                seed=self.config['seed'], epoch=self.epoch)
+        # the next pass draws different augmentations
+        self.epoch += 1
+        return prefetcher(tasks)
+
     def generator(self, shuffle=False):
         indices = np.arange(len(self))
         if shuffle == True:
             np.random.shuffle(indices)
+        if self.config['prefetch_workers'] > 0:
+            for samples in self.prefetch([index] for index in indices):
+                yield samples[0]
+            return
         index = 0
         while index < len(self):
             img, mask = self[indices[index]]
@@ -133,17 +370,43 @@ class DataLoader():
         indices = np.arange(len(self))
         if shuffle == True:
             np.random.shuffle(indices)
+        if self.config['batch_buffers'] > 0:
+            yield from self.buffered_batch_generator(indices, batch_size)
+            return
+        if self.config['prefetch_workers'] > 0:
+            batches = (indices[index:index + batch_size]
+                       for index in range(0, len(self) - batch_size + 1, batch_size))
+            for samples in self.prefetch(batches, function='batch', batched=True):
+                img_batch, mask_batch = zip(*samples)
+                yield list(img_batch), list(mask_batch)
+            return
         index = 0
         while index + batch_size <= len(self):
             img_batch = []
             mask_batch = []
-            for i in range(batch_size):
-                img, mask = self[indices[index + i]]
+            for img, mask in self.batch(indices[index:index + batch_size]):
                 img_batch.append(img)
                 mask_batch.append(mask)
             yield img_batch, mask_batch
             index = index + batch_size
 
+    def buffered_batch_generator(self, indices, batch_size=1):
+        """fills preallocated NCHW batches, the backend formats whole batches"""
+        backend = backends.backend()
+        if self.buffer is None:
+            self.buffer = BatchBuffer(size=self.config['batch_buffers'],
+                                      dtype=self.config['batch_dtype'],
+                                      mask_dtype=backend.mask_dtype)
+        batches = [indices[index:index + batch_size]
+                   for index in range(0, len(self) - batch_size + 1, batch_size)]
+        if self.config['prefetch_workers'] > 0:
+            samples = self.prefetch(batches, function='samples', batched=True)
+        else:
+            samples = (self.samples(batch) for batch in batches)
+        for batch in samples:
+            img_batch, mask_batch = self.buffer.fill(batch)
+            yield backend.batch_format(img_batch, mask_batch)
+
     def next(self):
         img, mask = self[self.current]
         self.current += 1
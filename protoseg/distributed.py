@@ -0,0 +1,29 @@
+import os
+
+# torchrun and torch.distributed.launch describe the process group in the environment
+
+
+def rank():
+    return int(os.environ.get('RANK', 0))
+
+
+def world_size():
+    return int(os.environ.get('WORLD_SIZE', 1))
+
+
+def local_rank():
+    """rank among the processes of this host"""
+    return int(os.environ.get('LOCAL_RANK', 0))
+
+
+def local_world_size():
+    return int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+
+
+def is_main():
+    """only the main process writes checkpoints, summaries and reports"""
+    return rank() == 0
+
+
+def enabled(config):
+    return bool(config.get('distributed')) and world_size() > 1
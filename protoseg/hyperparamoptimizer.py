@@ -24,11 +24,12 @@ class HyperParamOptimizer():
 
     def objective(self, params):
         self.trial += 1
-        self.trainer.model.load()
-        self.trainer.init()
         self.trainer.name = "trial{}_".format(self.trial)
         for param in params:
             self.trainer.config[param] = params[param]
+        # the optimizer and the loaders are created with the parameters of the trial
+        self.trainer.model.load()
+        self.trainer.init()
         start = timer()
         self.trainer.train(self.epochs)
         train_time = timer() - start
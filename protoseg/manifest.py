@@ -0,0 +1,153 @@
+import os
+import json
+import random
+from multiprocessing import Pool
+import cv2
+from tqdm import tqdm
+from . import archive
+
+
+def sample_id(filename):
+    """file name without extension and '_mask' suffix"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if name.endswith('_mask'):
+        name = name[:-len('_mask')]
+    return name
+
+
+def image_size(path):
+    img = archive.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return [img.shape[1], img.shape[0]]
+
+
+class Manifest():
+    """Maps sample ids to image path, mask path and image size [width, height].
+
+    Subsets like 'train', 'val' and 'test' are lists of ids, every id belongs
+    to at most one subset. Paths are stored relative to the directory of the
+    manifest file. An existing file is loaded unless load is False.
+    """
+
+    def __init__(self, path, load=True):
+        self.path = path
+        self.root = os.path.dirname(path)
+        self.samples = {}
+        self.subsets = {}
+        self.members = None  # ids of all subsets, built by add
+        if load and os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            manifest = json.load(f)
+        self.samples = manifest['samples']
+        self.subsets = manifest['subsets']
+        self.members = None
+
+    def save(self):
+        tmpfile = self.path + '.tmp'
+        with open(tmpfile, 'w') as f:
+            json.dump({'samples': self.samples, 'subsets': self.subsets}, f)
+        os.replace(tmpfile, self.path)
+        print('saved manifest to:', self.path)
+
+    def add(self, subset, id, image, mask=None, size=None):
+        """adds or updates a sample, an id which is already in a subset stays there"""
+        if self.members is None:
+            self.members = {id for ids in self.subsets.values() for id in ids}
+        sample = self.samples.get(id)
+        if size is None and sample and sample['image'] == image:
+            size = sample['size']
+        self.samples[id] = {'image': image, 'mask': mask, 'size': size}
+        ids = self.subsets.setdefault(subset, [])
+        if id not in self.members:
+            self.members.add(id)
+            ids.append(id)
+
+    def scan(self, subset):
+        """adds images of folder <subset> paired by id with masks of folder <subset>_masks"""
+        image_dir = os.path.join(self.root, subset)
+        masks_dir = os.path.join(self.root, subset + '_masks')
+        images = sorted(f for f in os.listdir(image_dir) if 'mask' not in f)
+        masks = {}
+        if os.path.isdir(masks_dir):
+            masks = {sample_id(f): os.path.join(subset + '_masks', f)
+                     for f in os.listdir(masks_dir)}
+        missing = 0
+        for f in images:
+            id = sample_id(f)
+            mask = masks.get(id)
+            if masks and mask is None:
+                missing += 1
+                continue
+            self.add(subset, id, os.path.join(subset, f), mask)
+        if missing:
+            print('{}: skipped {} images without mask'.format(subset, missing))
+
+    def scan_archive(self, subset, path, masks_dir=None):
+        """adds images of a zip or tar archive paired by id with masks of the same
+        archive or of folder masks_dir, nothing is extracted"""
+        names = archive.reader(self.resolve(path)).names()
+        images = [name for name in names if 'mask' not in os.path.basename(name)]
+        if masks_dir:
+            masks = {sample_id(f): os.path.join(masks_dir, f)
+                     for f in os.listdir(self.resolve(masks_dir))}
+        else:
+            masks = {sample_id(name): archive.join(path, name)
+                     for name in names if 'mask' in os.path.basename(name)}
+        missing = 0
+        for name in images:
+            id = sample_id(name)
+            mask = masks.get(id)
+            if masks and mask is None:
+                missing += 1
+                continue
+            self.add(subset, id, archive.join(path, name), mask)
+        if missing:
+            print('{}: skipped {} images without mask'.format(subset, missing))
+
+    def compute_sizes(self, processes=None):
+        ids = [id for id in self.samples if self.samples[id]['size'] is None]
+        if not ids:
+            return
+        paths = [self.resolve(self.samples[id]['image']) for id in ids]
+        archive.prepare(paths)
+        with Pool(processes) as pool:
+            sizes = pool.imap(image_size, paths, chunksize=64)
+            for id, size in tqdm(zip(ids, sizes), total=len(ids)):
+                self.samples[id]['size'] = size
+
+    def split(self, subset='train', val_percent=0.05, name='val'):
+        """moves a random part of subset into a new subset,
+        ids which already belong to another subset are removed from subset"""
+        others = set()
+        for other, ids in self.subsets.items():
+            if other != subset:
+                others.update(ids)
+        self.subsets[subset] = list(dict.fromkeys(id for id in self.subsets[subset] if id not in others))
+        ids = list(self.subsets[subset])
+        random.shuffle(ids)
+        n = int(len(ids) * val_percent)
+        moved = set(ids[:n])
+        self.subsets[subset] = [id for id in self.subsets[subset] if id not in moved]
+        self.subsets.setdefault(name, []).extend(sorted(moved))
+
+    def resolve(self, path):
+        if path is None:
+            return None
+        return os.path.join(self.root, path)
+
+    def images(self, subset):
+        return [self.resolve(self.samples[id]['image']) for id in self.subsets[subset]]
+
+    def masks(self, subset):
+        return [self.resolve(self.samples[id]['mask']) for id in self.subsets[subset]]
+
+    def min_size(self, subset):
+        """smallest width and height in subset or None if sizes are unknown"""
+        sizes = [self.samples[id]['size'] for id in self.subsets[subset]]
+        if not sizes or None in sizes:
+            return None
+        return min(size[0] for size in sizes), min(size[1] for size in sizes)
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+from multiprocessing import Pool
+import numpy as np
+import cv2
+from tqdm import tqdm
+from . import archive
+
+
+def mask_statistics(path):
+    """Foreground pixel count and bounding box [x0, y0, x1, y1] of a mask file."""
+    mtime = archive.getmtime(path)
+    mask = archive.imread(path, cv2.IMREAD_GRAYSCALE)
+    foreground = int(np.count_nonzero(mask))
+    bbox = None
+    if foreground > 0:
+        rows = np.flatnonzero(np.any(mask, axis=1))
+        cols = np.flatnonzero(np.any(mask, axis=0))
+        bbox = [int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1])]
+    return {'mtime': mtime, 'foreground': foreground, 'bbox': bbox}
+
+
+class MaskIndex():
+    """Sidecar file with per mask statistics.
+
+    Entries are keyed by mask path and rebuilt when the mtime of the mask changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.load()
+
+    def load(self):
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def stale(self, masks):
+        stale = []
+        for mask in masks:
+            entry = self.entries.get(mask)
+            if entry is None or entry['mtime'] != archive.getmtime(mask):
+                stale.append(mask)
+        return stale
+
+    def update(self, masks, processes=None, timeout=600):
+        """compute statistics of new or modified masks in parallel,
+        concurrent processes like distributed ranks wait for the one holding the lock file"""
+        if not self.stale(masks):
+            return
+        lockfile = self.path + '.lock'
+        try:
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self.wait(lockfile, timeout)
+            return self.update(masks, processes, timeout)
+        try:
+            # another process may have indexed the masks before the lock was taken
+            self.load()
+            stale = self.stale(masks)
+            if stale:
+                print('indexing {} masks'.format(len(stale)))
+                archive.prepare(stale)
+                with Pool(processes) as pool:
+                    statistics = pool.imap(mask_statistics, stale, chunksize=64)
+                    for mask, entry in tqdm(zip(stale, statistics), total=len(stale)):
+                        self.entries[mask] = entry
+                self.save()
+        finally:
+            os.close(fd)
+            os.remove(lockfile)
+
+    def wait(self, lockfile, timeout):
+        start = time.time()
+        while os.path.isfile(lockfile):
+            if time.time() - start > timeout:
+                raise Exception('mask index is locked, remove stale lock file ' + lockfile)
+            time.sleep(0.1)
+        self.load()
+
+    def save(self):
+        tmpfile = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmpfile, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmpfile, self.path)
+
+    def __getitem__(self, mask):
+        return self.entries[mask]
+
+    def __contains__(self, mask):
+        return mask in self.entries
+
+    def labeled(self, masks):
+        return [self.entries[mask]['foreground'] > 0 for mask in masks]
@@ -1,13 +1,38 @@
 from importlib import import_module
+import numpy as np
+from .metrices import confusion
+
+# metrices of the config which are computed from the confusion matrix
+CONFUSION_METRICES = {
+    'protoseg.metrices.accuracy.pixel_accuracy': confusion.pixel_accuracy,
+    'protoseg.metrices.accuracy.mean_accuracy': confusion.mean_accuracy,
+    'protoseg.metrices.dice.dice': confusion.dice,
+    'protoseg.metrices.iou.iou': confusion.iou,
+    'protoseg.metrices.jaccard.jaccard': confusion.jaccard,
+    'protoseg.metrices.confusion.pixel_accuracy': confusion.pixel_accuracy,
+    'protoseg.metrices.confusion.mean_accuracy': confusion.mean_accuracy,
+    'protoseg.metrices.confusion.dice': confusion.dice,
+    'protoseg.metrices.confusion.iou': confusion.iou,
+    'protoseg.metrices.confusion.miou': confusion.miou,
+    'protoseg.metrices.confusion.jaccard': confusion.jaccard,
+}
 
 
 class Metric():
+    """Measures the metrices of the config.
+
+    Known metrices are derived from one confusion matrix per batch, which is
+    also summed up for the epoch. Other functions get prediction and label of
+    every sample and are averaged over the epoch.
+    """
     global_step = 0
+    matrix = None  # confusion matrix of the epoch
 
     def __init__(self, config, summarywriter=None):
         self.config = config
         self.summarywriter = summarywriter
         assert(config)
+        self.classes = self.config.get('classes', 2)
 
         self.metrices = []
         metrices = self.config.get('metrices')
@@ -16,18 +41,67 @@ class Metric():
             for m in metrices:
                 name = list(m.keys())[0]
                 full_function = m[name]
+                if full_function in CONFUSION_METRICES:
+                    print(name, full_function)
+                    self.metrices.append(
+                        {'name': name, 'function': CONFUSION_METRICES[full_function], 'confusion': True})
+                    continue
                 module_name, function_name = full_function.rsplit('.', 1)
                 print(name, module_name, function_name)
                 mod = import_module(module_name)
                 met = getattr(mod, function_name)
                 self.metrices.append(
-                    {'name': name, 'function': met})
+                    {'name': name, 'function': met, 'confusion': False})
+        self.reset()
 
-    def __call__(self, prediction, label, prefix = ''):
-        self.global_step += 1
+    def reset(self):
+        self.matrix = np.zeros((self.classes, self.classes), dtype=np.int64)
+        self.sums = {}
+        self.count = 0
+
+    def update(self, prediction, label):
+        """adds a prediction or a batch of predictions to the epoch and returns their metrices"""
+        prediction = np.asarray(prediction)
+        label = np.asarray(label)
+        matrix = confusion.confusion_matrix(prediction, label, self.classes)
+        self.matrix += matrix
+        values = {}
+        predictions = prediction.reshape((-1,) + prediction.shape[-2:])
+        labels = label.reshape((-1,) + label.shape[-2:])
+        for m in self.metrices:
+            name = m['name']
+            if m['confusion']:
+                values[name] = m['function'](matrix)
+                continue
+            scores = [m['function'](p, l) for p, l in zip(predictions, labels)]
+            self.sums[name] = self.sums.get(name, 0.0) + np.sum(scores)
+            values[name] = np.mean(scores)
+        self.count += len(predictions)
+        return values
+
+    def values(self):
+        """metrices of the epoch"""
+        values = {}
         for m in self.metrices:
             name = m['name']
-            value = m['function'](prediction, label)
+            if m['confusion']:
+                values[name] = m['function'](self.matrix)
+            else:
+                values[name] = self.sums.get(name, 0.0) / max(self.count, 1)
+        return values
+
+    def log(self, prefix='', global_step=None):
+        """prints and logs the metrices of the epoch"""
+        for name, value in self.values().items():
+            print(name, "{0:.6f}".format(value))
+            if self.summarywriter:
+                self.summarywriter.add_scalar(
+                    prefix + name, value, global_step=global_step)
+
+    def __call__(self, prediction, label, prefix = ''):
+        self.global_step += 1
+        values = self.update(prediction, label)
+        for name, value in values.items():
             print(name, "{0:.6f}".format(value))
             if self.summarywriter:
                 self.summarywriter.add_scalar(
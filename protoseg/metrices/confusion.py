@@ -0,0 +1,61 @@
+# metrices derived from one confusion matrix, rows are labels and columns are predictions
+import numpy as np
+
+EPSILON = 0.00001
+
+
+def confusion_matrix(prediction, label, classes=2):
+    """classes x classes counts in one pass, values above classes count as the last class"""
+    label = np.minimum(np.asarray(label).astype(np.int64, copy=False).ravel(), classes - 1)
+    prediction = np.minimum(np.asarray(prediction).astype(np.int64, copy=False).ravel(), classes - 1)
+    counts = np.bincount(label * classes + prediction, minlength=classes * classes)
+    return counts.reshape(classes, classes)
+
+
+def pixel_accuracy(matrix):
+    '''
+    sum_i(n_ii) / sum_i(t_i)
+    '''
+    total = matrix.sum()
+    if total == 0:
+        return 0
+    return np.trace(matrix) / total
+
+
+def mean_accuracy(matrix):
+    '''
+    (1/n_cl) sum_i(n_ii/t_i) over classes in the label
+    '''
+    t = matrix.sum(axis=1)
+    present = t > 0
+    if not np.any(present):
+        return 0
+    return np.mean(np.diag(matrix)[present] / t[present])
+
+
+def iou(matrix):
+    """intersection over union of the foreground, all classes but 0"""
+    intersection = matrix[1:, 1:].sum()
+    union = matrix.sum() - matrix[0, 0]
+    return intersection / (union + EPSILON)
+
+
+def miou(matrix):
+    """mean intersection over union of the classes in label or prediction"""
+    intersection = np.diag(matrix)
+    union = matrix.sum(axis=0) + matrix.sum(axis=1) - intersection
+    present = union > 0
+    if not np.any(present):
+        return 0
+    return np.mean(intersection[present] / union[present])
+
+
+def dice(matrix):
+    """dice coefficient of the foreground"""
+    intersection = matrix[1:, 1:].sum()
+    return intersection * 2.0 / (matrix[:, 1:].sum() + matrix[1:, :].sum() + EPSILON)
+
+
+def jaccard(matrix):
+    """jaccard similarity of flattened label and prediction, which is the pixel accuracy"""
+    return pixel_accuracy(matrix)
@@ -0,0 +1,128 @@
+import multiprocessing
+import queue
+import numpy as np
+from . import backends
+
+
+def _context():
+    # forked workers inherit the loader, filters and backend without pickling
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def task_seed(seed, epoch, number):
+    """seed of a task, independent of the worker which loads it"""
+    return ((seed * 1000003 + epoch) * 1000003 + number) % 2**32
+
+
+def _worker(loader, function, batched, backend, tasks, results):
+    if backend and type(backends.backend()).__name__ != backend:
+        backends.set_backend(backend)
+    load = getattr(loader, function)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        number, seed, indices = task
+        loader.reseed(seed)
+        try:
+            if batched:
+                samples = load(indices)
+            else:
+                samples = [load(index) for index in indices]
+        except Exception as e:
+            samples = Exception(repr(e))
+        results.put((number, samples))
+    # do not block on exit if the consumer stopped reading
+    results.cancel_join_thread()
+
+
+class Prefetcher():
+    """Loads samples of a DataLoader in worker processes.
+
+    Each task is a list of indices, the generator yields the list of samples
+    for each task. At most queue_size tasks are in flight.
+    A batched function is called once with the indices of a task.
+    Every task is seeded from seed, epoch and task number, so results do not
+    depend on the number of workers and change between epochs.
+    """
+
+    def __init__(self, loader, function='__getitem__', batched=False, workers=2, queue_size=8, ordered=True,
+                 seed=None, epoch=0):
+        self.loader = loader
+        self.function = function
+        self.batched = batched
+        self.workers = workers
+        self.queue_size = max(queue_size, workers)
+        self.ordered = ordered
+        self.seed = seed
+        self.epoch = epoch
+        self.processes = []
+
+    def start(self):
+        ctx = _context()
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        backend = type(backends.backend()).__name__ if backends.backend() else None
+        self.processes = []
+        for i in range(self.workers):
+            process = ctx.Process(target=_worker, args=(
+                self.loader, self.function, self.batched, backend, self.tasks, self.results))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+
+    def get(self):
+        while True:
+            try:
+                return self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise Exception('prefetch worker died')
+
+    def __call__(self, tasks):
+        tasks = iter(tasks)
+        seed = self.seed
+        if seed is None:
+            seed = np.random.randint(0, 2**31)
+        self.start()
+        try:
+            submitted = 0
+            delivered = 0
+            buffered = {}
+            exhausted = False
+            while True:
+                while not exhausted and submitted - delivered < self.queue_size:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    self.tasks.put((submitted, task_seed(seed, self.epoch, submitted), list(task)))
+                    submitted += 1
+                if delivered == submitted:
+                    break
+                number, samples = self.get()
+                if isinstance(samples, Exception):
+                    raise samples
+                if not self.ordered:
+                    delivered += 1
+                    yield samples
+                    continue
+                buffered[number] = samples
+                while delivered in buffered:
+                    samples = buffered.pop(delivered)
+                    delivered += 1
+                    yield samples
+        finally:
+            self.close()
@@ -0,0 +1,138 @@
+import math
+import time
+import queue
+import threading
+import numpy as np
+
+
+def to_numpy(value):
+    """host copy of torch tensors, mxnet ndarrays and arrays"""
+    if hasattr(value, 'asnumpy'):
+        return value.asnumpy()
+    if hasattr(value, 'detach'):
+        return value.detach().cpu().numpy()
+    return np.array(value)
+
+
+def downsample(img, size):
+    """strided downsampling of HW, CHW or HWC images to at most size pixels per side"""
+    if size <= 0 or img.ndim not in [2, 3]:
+        return img
+    if img.ndim == 3 and img.shape[0] in [1, 3, 4]:
+        height, width = img.shape[1:]
+        step = int(math.ceil(max(height, width) / size))
+        return img[:, ::step, ::step]
+    height, width = img.shape[:2]
+    step = int(math.ceil(max(height, width) / size))
+    return img[::step, ::step]
+
+
+def add_image(writer, tag, image, global_step=None):
+    """adds the image returned by the function image, an AsyncSummaryWriter
+    calls it only if the tag is due, so skipped images are never computed"""
+    if isinstance(writer, AsyncSummaryWriter):
+        writer.add_image(tag, image, global_step=global_step)
+    else:
+        writer.add_image(tag, to_numpy(image()), global_step=global_step)
+
+
+class AsyncSummaryWriter():
+    """Writes scalars and images of a summary writer in a background thread.
+
+    Scalars and images are rate limited per tag, a tag is logged at most once
+    per global step and again after scalar_interval or image_interval seconds.
+    Images are copied to the host, the thread downsamples and encodes them.
+    An image may be given as function, which is called only if it is due.
+    Images are dropped while queue_size events wait, scalars are never dropped.
+    All other methods are called on the writer after the pending events.
+    """
+
+    thread = None
+    dropped = 0
+
+    def __init__(self, writer, queue_size=64, scalar_interval=0.0, image_interval=10.0, image_size=256):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.scalar_interval = scalar_interval
+        self.image_interval = image_interval
+        self.image_size = image_size
+        self.logged = {}  # global step and time of the last event by tag
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is None:
+                    break
+                name, args, kwargs = event
+                if name == 'add_image':
+                    args = (args[0], downsample(args[1], self.image_size)) + args[2:]
+                getattr(self.writer, name)(*args, **kwargs)
+            except Exception as e:
+                print('summary writer:', e)
+            finally:
+                self.queue.task_done()
+
+    def due(self, tag, global_step, interval):
+        """rate limit per tag"""
+        now = time.monotonic()
+        if tag in self.logged:
+            last_step, last_time = self.logged[tag]
+            if global_step is not None and global_step == last_step:
+                return False
+            if now - last_time < interval:
+                return False
+        self.logged[tag] = (global_step, now)
+        return True
+
+    def add_scalar(self, *args, **kwargs):
+        # tensorboardX and mxboard name the arguments differently
+        tag = kwargs.get('tag', args[0] if args else None)
+        global_step = kwargs.get('global_step', args[2] if len(args) > 2 else None)
+        if not self.due(('scalar', tag), global_step, self.scalar_interval):
+            return
+        self.start()
+        self.queue.put(('add_scalar', args, kwargs))
+
+    def add_image(self, tag, img_tensor, global_step=None, **kwargs):
+        if not self.due(('image', tag), global_step, self.image_interval):
+            return
+        if callable(img_tensor):
+            img_tensor = img_tensor()
+        self.start()
+        try:
+            self.queue.put_nowait(('add_image', (tag, to_numpy(img_tensor), global_step), kwargs))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """blocks until all events are written"""
+        if self.thread:
+            self.queue.join()
+        if hasattr(self.writer, 'flush'):
+            self.writer.flush()
+
+    def close(self):
+        self.flush()
+        if self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+        self.writer.close()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.writer, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            if self.thread:
+                self.queue.join()
+            return attribute(*args, **kwargs)
+        return call
@@ -2,7 +2,10 @@
 from .config import Config
 from .dataloader import DataLoader
 from .metric import Metric
+from .checkpoint import CheckpointWriter
+from .summary import AsyncSummaryWriter
 from . import backends
+from . import distributed
 
 class Trainer():
 
@@ -11,6 +14,9 @@ class Trainer():
     global_step = 0
     loss = 0.0
     summarywriter = None
+    batch_augmentation = None
+    train_loader = None  # backend loaders of dataloader and valdataloader
+    val_loader = None
 
     
     def before_epoch(self):
@@ -20,7 +26,8 @@ class Trainer():
     def after_epoch(self):
         print('epoch finished. loss:', self.loss)
         
-        backends.backend().save_model(self.model)
+        if distributed.is_main():
+            backends.backend().save_model(self.model, writer=self.checkpoint_writer, tag=self.epoch)
 
 
 
@@ -33,10 +40,17 @@ class Trainer():
         self.dataloader = dataloader
         self.valdataloader = valdataloader
         self.summarywriter = summarywriter
+        if summarywriter and config['async_summary']:
+            self.summarywriter = AsyncSummaryWriter(summarywriter, queue_size=config['summary_queue'],
+                                                    scalar_interval=config['summary_scalar_interval'],
+                                                    image_interval=config['summary_image_interval'],
+                                                    image_size=config['summary_image_size'])
         assert(config)
         assert(model)
         assert(dataloader)
         self.metric = Metric(self.config, self.summarywriter)
+        self.checkpoint_writer = CheckpointWriter(keep=self.config['checkpoint_keep'],
+                                                  background=self.config['async_checkpoint'])
         self.init()
 
     def init(self):
@@ -57,8 +71,16 @@ class Trainer():
             
             backends.backend().train_epoch(self)
 
-            if self.valdataloader:
+            if self.valdataloader and distributed.is_main():
+                self.metric.reset()
                 backends.backend().validate_epoch(self)
+                self.metric.log(prefix=self.name, global_step=self.epoch)
 
             if self.after_epoch_callback:
                 self.after_epoch_callback()
+
+        self.checkpoint_writer.flush()
+        if self.summarywriter:
+            self.summarywriter.flush()
+        if self.config['export_onnx'] and distributed.is_main():
+            backends.backend().export_model(self.model)
@@ -8,6 +8,8 @@ import numpy as np
 import pandas as pd
 import cv2
 
+from protoseg.manifest import Manifest
+
 
 def unzip(kaggledatapath, datapath):
     data_folder = datapath
@@ -132,6 +134,17 @@ def split_val(datapath):
         print(i, "/", l, id)
 
 
+def build_manifest(kaggledatapath, datapath):
+    """writes a manifest which reads images straight from the competition archives,
+    only the masks are generated from the run-length encoded csv"""
+    manifest = Manifest(os.path.join(datapath, "manifest.json"), load=False)
+    manifest.scan_archive('train', os.path.abspath(os.path.join(kaggledatapath, "train_v2.zip")),
+                          masks_dir="train_masks")
+    manifest.scan_archive('test', os.path.abspath(os.path.join(kaggledatapath, "test_v2.zip")))
+    manifest.split('train', val_percent=0.05)
+    manifest.save()
+
+
 def move_train_masks(datapath):
     """moves mask files to 'train_masks' folder"""
     train_path = os.path.join(datapath, "train/")
@@ -147,9 +160,14 @@ def move_train_masks(datapath):
 
 if __name__ == "__main__":
     datapath = '../data/'
-    kaggledatapath = sys.argv[1]
-    if len(sys.argv) == 3:
-        datapath = sys.argv[2]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    kaggledatapath = args[0]
+    if len(args) == 2:
+        datapath = args[1]
+    if '--archive' in sys.argv:
+        generate_masks(kaggledatapath, datapath)
+        build_manifest(kaggledatapath, datapath)
+        sys.exit(0)
     unzip(kaggledatapath, datapath)
     generate_masks(kaggledatapath, datapath)
     split_val(datapath)
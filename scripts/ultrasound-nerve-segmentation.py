@@ -5,6 +5,8 @@ import shutil
 import sys
 import zipfile
 
+from protoseg.manifest import Manifest
+
 def unzip(kaggledatapath, datapath):
     data_folder = datapath
     competition_path = kaggledatapath
@@ -59,6 +61,16 @@ def split_val(datapath):
         dest_mask = os.path.join(val_masks_path, id + "_mask.tif")
         shutil.move(source_mask, dest_mask)
 
+def build_manifest(kaggledatapath, datapath):
+    """writes a manifest which reads images and masks straight from the competition archives"""
+    if not os.path.exists(datapath):
+        os.makedirs(datapath)
+    manifest = Manifest(os.path.join(datapath, "manifest.json"), load=False)
+    manifest.scan_archive('train', os.path.abspath(os.path.join(kaggledatapath, "train.zip")))
+    manifest.scan_archive('test', os.path.abspath(os.path.join(kaggledatapath, "test.zip")))
+    manifest.split('train', val_percent=0.05)
+    manifest.save()
+
 def move_train_masks(datapath):
     """moves mask files to 'train_masks' folder"""
     train_path = os.path.join(datapath, "train/")
@@ -73,9 +85,13 @@ def move_train_masks(datapath):
 
 if __name__ == "__main__":
     datapath = '../data/'
-    kaggledatapath = sys.argv[1]
-    if len(sys.argv) == 3:
-        datapath= sys.argv[2]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    kaggledatapath = args[0]
+    if len(args) == 2:
+        datapath= args[1]
+    if '--archive' in sys.argv:
+        build_manifest(kaggledatapath, datapath)
+        sys.exit(0)
     unzip(kaggledatapath, datapath)
     split_val(datapath)
     move_train_masks(datapath)
\ No newline at end of file
@@ -36,6 +36,8 @@ setuptools.setup(name='protoseg',
                      "Operating System :: OS Independent",
                  ), entry_points='''
                     [console_scripts]
+                    protoseg-benchmark=protoseg.cli.benchmark:main
+                    protoseg-manifest=protoseg.cli.manifest:main
                     protoseg-submit=protoseg.cli.submit:main
                     protoseg-train=protoseg.cli.train:main
                     ''',
@@ -0,0 +1,52 @@
+import os
+import zipfile
+import tarfile
+import numpy as np
+import cv2
+from protoseg import archive
+
+
+def write_image(path):
+    img = np.arange(12 * 10, dtype=np.uint8).reshape(12, 10)
+    cv2.imwrite(path, img)
+    return img
+
+
+def test_zip(tmpdir):
+    img = write_image(str(tmpdir.join('1.png')))
+    path = str(tmpdir.join('train.zip'))
+    with zipfile.ZipFile(path, 'w') as z:
+        z.write(str(tmpdir.join('1.png')), 'train/1.png')
+    assert archive.reader(path).names() == ['train/1.png']
+    read = archive.imread(archive.join(path, 'train/1.png'), cv2.IMREAD_GRAYSCALE)
+    assert np.array_equal(read, img)
+
+
+def test_tar(tmpdir):
+    img = write_image(str(tmpdir.join('1.png')))
+    path = str(tmpdir.join('shard.tar'))
+    with tarfile.open(path, 'w') as t:
+        t.add(str(tmpdir.join('1.png')), 'train/1.png')
+    read = archive.imread(archive.join(path, 'train/1.png'), cv2.IMREAD_GRAYSCALE)
+    assert np.array_equal(read, img)
+    assert os.path.isfile(path + '.index.json')
+    assert sorted(os.listdir(str(tmpdir))) == ['1.png', 'shard.tar', 'shard.tar.index.json']
+
+
+def test_index_is_inherited(tmpdir):
+    write_image(str(tmpdir.join('1.png')))
+    path = str(tmpdir.join('other.tar'))
+    with tarfile.open(path, 'w') as t:
+        t.add(str(tmpdir.join('1.png')), 'train/1.png')
+    archive.prepare([archive.join(path, 'train/1.png'), str(tmpdir.join('1.png'))])
+    os.remove(path + '.index.json')
+    # a forked process reopens the file but keeps the index of its parent
+    archive.reader(path).pid = None
+    assert archive.reader(path).names() == ['train/1.png']
+    assert not os.path.isfile(path + '.index.json')
+
+
+def test_plain_file(tmpdir):
+    img = write_image(str(tmpdir.join('1.png')))
+    read = archive.imread(str(tmpdir.join('1.png')), cv2.IMREAD_GRAYSCALE)
+    assert np.array_equal(read, img)
@@ -0,0 +1,99 @@
+import random
+import numpy as np
+import cv2
+from protoseg import Config
+from protoseg.augmentation import Augmentation
+
+
+def augmentation(**options):
+    return Augmentation(Config(configs={'run1': options}).get())
+
+
+def image(seed=0, shape=(24, 32, 3)):
+    return np.random.RandomState(seed).randint(0, 256, shape).astype(np.uint8)
+
+
+def test_random_geometry_flips_like_cv2():
+    for horizontal_flip in [True, False]:
+        aug = augmentation(flip=True, horizontal_flip=horizontal_flip)
+        img = image()
+        mask = image(1, img.shape[:2])
+        flipped = 0
+        for seed in range(20):
+            random.seed(seed)
+            expected = aug.random_flip(img.copy(), mask.copy())
+            random.seed(seed)
+            result = aug.random_geometry(img, mask)
+            assert np.array_equal(result[0], expected[0])
+            assert np.array_equal(result[1], expected[1])
+            flipped += not np.array_equal(result[0], img)
+        assert flipped > 0
+        for code in [0, 1]:
+            assert any(np.array_equal(aug.random_geometry(img), cv2.flip(img, code))
+                       for _ in range(50)) == (horizontal_flip or code == 1)
+
+
+def test_random_geometry_rotates_and_shifts_like_warps():
+    aug = augmentation(rotation_degree=30)
+    img = image()
+    mask = image(1, img.shape[:2])
+    for seed in range(5):
+        random.seed(seed)
+        expected = aug.random_rotation(img, mask)
+        random.seed(seed)
+        result = aug.random_geometry(img, mask)
+        assert np.array_equal(result[0], expected[0])
+    aug = augmentation(horizontal_shift=10, vertical_shift=6)
+    for seed in range(5):
+        # the old chain draws a rotation angle before the shift
+        random.seed(seed)
+        expected = aug.random_shift(*aug.random_rotation(img, mask), scale=2.0)
+        random.seed(seed)
+        result = aug.random_geometry(img, mask, scale=2.0)
+        assert np.array_equal(result[0], expected[0])
+
+
+def test_random_geometry_resizes_to_dsize():
+    aug = augmentation(flip=True, rotation_degree=10, zoom_in=0.2, zoom_out=0.2)
+    img, mask = aug.random_geometry(image(), image(1, (24, 32)), dsize=(16, 12), mask_dsize=(8, 6))
+    assert img.shape == (12, 16, 3) and mask.shape == (6, 8)
+
+
+def ramp(shape=(16, 16, 3)):
+    """every uint8 value"""
+    return (np.arange(np.prod(shape)) % 256).reshape(shape).astype(np.uint8)
+
+
+def test_brightness_lut_matches_arithmetic():
+    for min_val, max_val in [(0, 255), (20, 200)]:
+        aug = augmentation(min_bright=-40, max_bright=40, min_val=min_val, max_val=max_val)
+        for seed in range(20):
+            # float images take the np.where arithmetic
+            random.seed(seed)
+            expected = aug.random_brightness(ramp().astype(np.float32))
+            random.seed(seed)
+            result = aug.random_brightness(ramp())
+            assert result.dtype == np.uint8
+            assert np.array_equal(result, expected.astype(np.uint8))
+
+
+def test_contrast_lut_matches_arithmetic():
+    aug = augmentation(min_contrast=0.5, max_contrast=1.8, min_val=10, max_val=250)
+    for seed in range(20):
+        random.seed(seed)
+        expected = aug.random_contrast(ramp().astype(np.float32))
+        random.seed(seed)
+        result = aug.random_contrast(ramp())
+        assert np.array_equal(result, expected.astype(np.uint8))
+
+
+def test_noise_saturates():
+    aug = augmentation(noise_amount=20, noise_chance=0.05)
+    img = ramp()
+    aug.reseed(5)
+    noise = aug.noise(img.size, 20).reshape(img.shape)
+    aug.reseed(5)
+    random.seed(0)
+    result = aug.random_noise(img.copy())
+    assert np.array_equal(result, np.minimum(img.astype(int) + noise, 255))
+    assert np.any(noise > 0)
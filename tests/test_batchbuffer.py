@@ -0,0 +1,46 @@
+import numpy as np
+from protoseg.batchbuffer import BatchBuffer
+
+
+def samples(value, count=2, gray=False):
+    shape = (4, 6) if gray else (4, 6, 3)
+    return [(np.full(shape, value + i, dtype=np.uint8), np.full((4, 6), (value + i) % 2 * 255, dtype=np.uint8))
+            for i in range(count)]
+
+
+def test_fill_formats_batches():
+    buffer = BatchBuffer(size=2)
+    images, masks = buffer.fill(samples(1))
+    assert images.shape == (2, 3, 4, 6) and images.dtype == np.float32
+    assert masks.shape == (2, 4, 6) and masks.dtype == np.int64
+    assert np.all(images[0] == 1) and np.all(images[1] == 2)
+    # binary masks
+    assert np.all(masks[0] == 1) and np.all(masks[1] == 0)
+    images, _ = buffer.fill(samples(1, gray=True))
+    assert images.shape == (2, 3, 4, 6) and np.all(images[1] == 2)
+
+
+def test_ring_reuses_slots():
+    buffer = BatchBuffer(size=2)
+    first, _ = buffer.fill(samples(10))
+    second, _ = buffer.fill(samples(20))
+    assert not np.shares_memory(first, second)
+    assert np.all(first[0] == 10)
+    third, masks = buffer.fill(samples(30))
+    # the ring wrapped around, the slot of the first batch is overwritten
+    assert np.shares_memory(first, third)
+    assert np.all(third[0] == 30) and np.all(third[1] == 31)
+    assert np.all(masks[1] == 1)
+    # a smaller last batch uses the same slot without stale samples
+    last, masks = buffer.fill(samples(40, count=1))
+    assert np.shares_memory(second, last)
+    assert last.shape[0] == 1 and masks.shape[0] == 1 and np.all(last == 40)
+
+
+def test_reallocates_for_new_shapes():
+    buffer = BatchBuffer(size=1)
+    buffer.fill(samples(1))
+    images, masks = buffer.fill([(np.zeros((8, 8, 3), np.uint8), None)] * 3)
+    assert images.shape == (3, 3, 8, 8) and masks is None
+    images, masks = buffer.fill(samples(1))
+    assert images.shape == (2, 3, 4, 6) and masks.shape == (2, 4, 6)
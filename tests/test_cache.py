@@ -0,0 +1,48 @@
+import numpy as np
+from protoseg.cache import SampleCache, cache_key
+
+
+def sample(value, dtype=np.uint8):
+    return np.full((4, 6, 3), value, dtype=dtype), np.full((4, 6), value % 2, dtype=np.uint8)
+
+
+def test_cache_key():
+    config = {'width': 32, 'height': 32}
+    assert cache_key(config, ['a.png']) == cache_key(dict(config), ['a.png'])
+    assert cache_key(config, ['a.png']) != cache_key({'width': 64, 'height': 32}, ['a.png'])
+    assert cache_key(config, ['a.png']) != cache_key(config, ['b.png'])
+
+
+def test_fill_and_reopen(tmpdir):
+    cache = SampleCache(str(tmpdir), 'key', 3)
+    assert not cache.ready()
+    cache.create(*sample(0))
+    assert cache.ready() and 1 not in cache
+    cache[1] = sample(5)
+    # samples of another shape are not stored
+    cache[2] = (np.zeros((2, 2, 3), np.uint8), np.zeros((2, 2), np.uint8))
+    assert 1 in cache and 2 not in cache
+
+    cache = SampleCache(str(tmpdir), 'key', 3)
+    assert cache.ready() and cache.matches(*sample(0))
+    assert 1 in cache and 0 not in cache and 2 not in cache
+    img, mask = cache[1]
+    assert np.array_equal(img, sample(5)[0]) and np.array_equal(mask, sample(5)[1])
+    img[:] = 9  # copies, the store is unchanged
+    assert cache[1][0][0, 0, 0] == 5
+
+
+def test_mismatch_rebuilds(tmpdir):
+    cache = SampleCache(str(tmpdir), 'key', 3)
+    cache.create(*sample(0))
+    cache[1] = sample(5)
+
+    cache = SampleCache(str(tmpdir), 'key', 3)
+    assert not cache.matches(*sample(0, dtype=np.float32))
+    assert not cache.matches(sample(0)[0], None)
+    cache.create(*sample(0, dtype=np.float32))
+    assert cache.matches(*sample(0, dtype=np.float32))
+    assert 1 not in cache
+
+    cache = SampleCache(str(tmpdir), 'key', 3)
+    assert cache.images.dtype == np.float32 and 1 not in cache
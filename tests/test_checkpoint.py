@@ -0,0 +1,29 @@
+import os
+import json
+from protoseg.checkpoint import CheckpointWriter
+
+
+def save(state, filename):
+    with open(filename, 'w') as f:
+        json.dump(state, f)
+
+
+def test_background_writer(tmpdir):
+    path = str(tmpdir.join('model.checkpoint'))
+    writer = CheckpointWriter()
+    for epoch in range(3):
+        writer.write(path, save, {'epoch': epoch}, tag=epoch)
+    writer.flush()
+    with open(path) as f:
+        assert json.load(f) == {'epoch': 2}
+    assert sorted(os.listdir(str(tmpdir))) == ['model.checkpoint']
+    writer.close()
+
+
+def test_keep(tmpdir):
+    path = str(tmpdir.join('model.checkpoint'))
+    writer = CheckpointWriter(keep=2, background=False)
+    for epoch in range(4):
+        writer.write(path, save, {'epoch': epoch}, tag=epoch)
+        os.utime(path + '.' + str(epoch), (epoch, epoch))
+    assert sorted(os.listdir(str(tmpdir))) == ['model.checkpoint', 'model.checkpoint.2', 'model.checkpoint.3']
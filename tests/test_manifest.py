@@ -0,0 +1,60 @@
+import os
+from protoseg.manifest import Manifest, sample_id
+
+
+def touch(path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+
+def test_sample_id():
+    assert sample_id('train/1_2.tif') == '1_2'
+    assert sample_id('train_masks/1_2_mask.tif') == '1_2'
+
+
+def test_scan_pairs_by_id(tmpdir):
+    root = str(tmpdir)
+    for name in ['a', 'b', 'c']:
+        touch(os.path.join(root, 'train', name + '.tif'))
+    for name in ['a', 'c']:
+        touch(os.path.join(root, 'train_masks', name + '_mask.tif'))
+    manifest = Manifest(os.path.join(root, 'manifest.json'))
+    manifest.scan('train')
+    assert manifest.subsets['train'] == ['a', 'c']
+    assert manifest.images('train')[1] == os.path.join(root, 'train', 'c.tif')
+    assert manifest.masks('train')[1] == os.path.join(root, 'train_masks', 'c_mask.tif')
+
+
+def test_split_and_reload(tmpdir):
+    root = str(tmpdir)
+    for i in range(20):
+        touch(os.path.join(root, 'train', '{}.jpg'.format(i)))
+    manifest = Manifest(os.path.join(root, 'manifest.json'))
+    manifest.scan('train')
+    manifest.split('train', val_percent=0.25)
+    manifest.save()
+    manifest = Manifest(os.path.join(root, 'manifest.json'))
+    assert len(manifest.subsets['train']) == 15
+    assert len(manifest.subsets['val']) == 5
+    assert not set(manifest.subsets['train']) & set(manifest.subsets['val'])
+
+
+def test_rescan_is_idempotent(tmpdir):
+    root = str(tmpdir)
+    for i in range(10):
+        touch(os.path.join(root, 'train', '{}.jpg'.format(i)))
+    for rerun in range(2):
+        manifest = Manifest(os.path.join(root, 'manifest.json'), load=False)
+        manifest.scan('train')
+        manifest.split('train', val_percent=0.2)
+        manifest.save()
+    manifest = Manifest(os.path.join(root, 'manifest.json'))
+    assert len(manifest.subsets['train']) == 8
+    assert len(manifest.subsets['val']) == 2
+    # scanning into a loaded manifest keeps ids in their subsets
+    manifest.scan('train')
+    manifest.split('train', val_percent=0)
+    assert len(manifest.subsets['train']) == 8
+    assert len(manifest.subsets['val']) == 2
+    assert not set(manifest.subsets['train']) & set(manifest.subsets['val'])
@@ -0,0 +1,50 @@
+import os
+import pytest
+import numpy as np
+import cv2
+from protoseg.maskindex import MaskIndex
+
+
+def write_masks(path):
+    empty = np.zeros((20, 30), dtype=np.uint8)
+    labeled = empty.copy()
+    labeled[5:8, 10:15] = 255
+    masks = [os.path.join(path, 'empty.png'), os.path.join(path, 'labeled.png')]
+    cv2.imwrite(masks[0], empty)
+    cv2.imwrite(masks[1], labeled)
+    return masks
+
+
+def test_statistics(tmpdir):
+    masks = write_masks(str(tmpdir))
+    index = MaskIndex(str(tmpdir.join('index.json')))
+    index.update(masks, processes=1)
+    assert index[masks[0]]['foreground'] == 0
+    assert index[masks[0]]['bbox'] is None
+    assert index[masks[1]]['foreground'] == 15
+    assert index[masks[1]]['bbox'] == [10, 5, 14, 7]
+    assert index.labeled(masks) == [False, True]
+
+
+def test_reload(tmpdir):
+    masks = write_masks(str(tmpdir))
+    index = MaskIndex(str(tmpdir.join('index.json')))
+    index.update(masks, processes=1)
+    index = MaskIndex(str(tmpdir.join('index.json')))
+    assert index.stale(masks) == []
+    os.utime(masks[0], (0, 0))
+    assert index.stale(masks) == [masks[0]]
+
+
+def test_lock(tmpdir):
+    masks = write_masks(str(tmpdir))
+    path = str(tmpdir.join('index.json'))
+    # another process holds the lock and never finishes
+    open(path + '.lock', 'w').close()
+    with pytest.raises(Exception, match='stale lock file'):
+        MaskIndex(path).update(masks, processes=1, timeout=0.2)
+    os.remove(path + '.lock')
+    index = MaskIndex(path)
+    index.update(masks, processes=1)
+    assert index.labeled(masks) == [False, True]
+    assert sorted(os.listdir(str(tmpdir))) == ['empty.png', 'index.json', 'labeled.png']
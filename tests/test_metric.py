@@ -0,0 +1,51 @@
+import numpy as np
+from protoseg import Metric
+from protoseg.metrices import confusion
+from protoseg.metrices.accuracy import pixel_accuracy, mean_accuracy
+from protoseg.metrices.dice import dice
+from protoseg.metrices.iou import iou
+
+
+def random_masks(seed=0):
+    random_state = np.random.RandomState(seed)
+    prediction = random_state.randint(0, 2, (32, 24))
+    label = random_state.randint(0, 2, (32, 24))
+    return prediction, label
+
+
+def test_confusion_metrices():
+    prediction, label = random_masks()
+    matrix = confusion.confusion_matrix(prediction, label, 2)
+    assert matrix.sum() == prediction.size
+    assert np.isclose(confusion.pixel_accuracy(matrix), pixel_accuracy(prediction, label))
+    assert np.isclose(confusion.mean_accuracy(matrix), mean_accuracy(prediction, label))
+    assert np.isclose(confusion.dice(matrix), dice(prediction, label))
+    assert np.isclose(confusion.iou(matrix), iou(prediction, label))
+    assert np.isclose(confusion.jaccard(matrix), np.mean(prediction == label))
+
+
+def test_epoch_matrix():
+    metric = Metric({'classes': 2, 'metrices': [{'iou': 'protoseg.metrices.iou.iou'}]})
+    for seed in range(3):
+        metric(*random_masks(seed))
+    predictions, labels = zip(*[random_masks(seed) for seed in range(3)])
+    matrix = confusion.confusion_matrix(np.stack(predictions), np.stack(labels), 2)
+    assert np.array_equal(metric.matrix, matrix)
+    assert np.isclose(metric.values()['iou'], confusion.iou(matrix))
+    metric.reset()
+    assert metric.matrix.sum() == 0
+
+
+def test_batch_update():
+    metric = Metric({'classes': 2, 'metrices': [{'iou': 'protoseg.metrices.iou.iou'},
+                                                {'equal': 'numpy.array_equal'}]})
+    predictions, labels = zip(*[random_masks(seed) for seed in range(4)])
+    predictions = np.stack(predictions)
+    labels = np.stack(labels)
+    predictions[3] = labels[3]
+    metric.update(predictions[:3], labels[:3])
+    metric.update(predictions[3:], labels[3:])
+    values = metric.values()
+    assert metric.count == 4
+    assert np.isclose(values['iou'], confusion.iou(confusion.confusion_matrix(predictions, labels, 2)))
+    assert np.isclose(values['equal'], 0.25)
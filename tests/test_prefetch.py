@@ -0,0 +1,38 @@
+import numpy as np
+from protoseg.prefetch import Prefetcher, task_seed
+
+
+class Loader():
+    """random samples which only depend on the seed of the task"""
+
+    def reseed(self, seed):
+        np.random.seed(seed % 2**32)
+
+    def __getitem__(self, index):
+        return np.random.rand(4) + index
+
+
+def prefetch(workers, epoch=0, ordered=True):
+    prefetcher = Prefetcher(Loader(), workers=workers, queue_size=4, ordered=ordered, seed=3, epoch=epoch)
+    return [np.stack(samples) for samples in prefetcher([[i, i + 1] for i in range(0, 12, 2)])]
+
+
+def test_task_seed():
+    assert task_seed(3, 0, 1) != task_seed(3, 1, 1)
+    assert task_seed(3, 0, 1) != task_seed(3, 0, 2)
+    assert 0 <= task_seed(2**40, 7, 7) < 2**32
+
+
+def test_reproducible_with_any_number_of_workers():
+    single = prefetch(workers=1)
+    assert len(single) == 6
+    for workers in [2, 3]:
+        batches = prefetch(workers=workers)
+        assert all(np.array_equal(a, b) for a, b in zip(single, batches))
+    # unordered batches are the same set
+    unordered = sorted(prefetch(workers=3, ordered=False), key=lambda batch: batch[0, 0])
+    assert all(np.array_equal(a, b) for a, b in zip(single, unordered))
+
+
+def test_epochs_differ():
+    assert not np.array_equal(prefetch(workers=2, epoch=0)[0], prefetch(workers=2, epoch=1)[0])
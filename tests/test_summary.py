@@ -0,0 +1,53 @@
+import numpy as np
+from protoseg.summary import AsyncSummaryWriter, add_image, downsample
+
+
+class Writer():
+
+    def __init__(self):
+        self.events = []
+
+    def add_scalar(self, tag, scalar_value, global_step=None):
+        self.events.append((tag, scalar_value, global_step))
+
+    def add_image(self, tag, img_tensor, global_step=None):
+        self.events.append((tag, img_tensor.shape, global_step))
+
+    def close(self):
+        pass
+
+
+def test_downsample():
+    assert downsample(np.zeros((3, 512, 256)), 256).shape == (3, 256, 128)
+    assert downsample(np.zeros((512, 500, 3)), 256).shape == (256, 250, 3)
+    assert downsample(np.zeros((100, 100)), 256).shape == (100, 100)
+
+
+def test_rate_limits():
+    writer = Writer()
+    summary = AsyncSummaryWriter(writer, scalar_interval=0.0, image_interval=60.0, image_size=64)
+    for step in range(5):
+        summary.add_scalar('loss', float(step), global_step=step)
+        summary.add_image('image', np.zeros((3, 128, 128)), global_step=step)
+    summary.add_scalar('loss', 5.0, global_step=4)
+    summary.close()
+    assert [e for e in writer.events if e[0] == 'loss'] == [('loss', float(step), step) for step in range(5)]
+    assert [e for e in writer.events if e[0] == 'image'] == [('image', (3, 64, 64), 0)]
+
+
+def test_images_are_computed_when_due():
+    calls = []
+
+    def image():
+        calls.append(1)
+        return np.zeros((3, 32, 32))
+
+    writer = Writer()
+    summary = AsyncSummaryWriter(writer, image_interval=60.0)
+    for step in range(5):
+        add_image(summary, 'predicted', image, global_step=step)
+    summary.close()
+    assert len(calls) == 1
+    add_image(writer, 'predicted', image, global_step=5)
+    assert len(calls) == 2
+    assert writer.events[-1] == ('predicted', (3, 32, 32), 5)